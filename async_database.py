@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import certifi
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from blob_store import BlobStore
+from document_cache import DocumentCache
+from mongo_monitoring import MongoMetrics, client_options
+from database import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ORIGINAL_PROJECTION, PENDING_QUERY, PENDING_SORT,
+    SEARCH_SORT, STATS_FIELDS, STATS_ID, STATS_PIPELINE, after_cursor, attachment_query, build_document,
+    build_search_query, build_status_update, build_text_completion, count_by_status, document_projection,
+    encode_cursor, finish_status_updates, load_original, plan_status_updates,
+    serialize_document, stats_increments
+)
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """Motor counterpart of Database for use from the event loop
+
+    Indexes are created by the synchronous Database; this class only reads
+    and writes documents. Blob store calls run in a thread.
+    """
+
+    def __init__(self, blob_store: Optional[BlobStore] = None, document_cache: Optional[DocumentCache] = None,
+                 metrics: Optional[MongoMetrics] = None):
+        self.client = None
+        self.db = None
+        self.blob_store = blob_store
+        self.document_cache = document_cache
+        self.metrics = metrics
+
+    def _invalidate(self, *document_ids: str):
+        if self.document_cache is not None:
+            for document_id in document_ids:
+                self.document_cache.invalidate(document_id)
+
+    async def connect(self):
+        """Connect to MongoDB"""
+        logger.info("Connecting to MongoDB (async)...")
+        try:
+            mongo_url = os.getenv("MONGODB_URI")
+            if not mongo_url:
+                raise ValueError("Missing MONGODB_URI in environment variables")
+
+            # One client, and so one connection pool, serves every request
+            self.client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where(), **client_options(self.metrics))
+            self.db = self.client.accounting_automation
+
+            await self.client.admin.command('ping')
+            logger.info("Connected to MongoDB (async) successfully")
+        except Exception as e:
+            logger.error(f"Failed to connect to MongoDB: {str(e)}")
+            raise
+
+    async def store_document(self, *, email_id: str, extracted_data: Dict[str, Any],
+                             original_content: bytes = None, content_type: str = None,
+                             subject: str = None, sender: str = None) -> Optional[str]:
+        """Store a processed document, or get the id of the one already stored for its attachment"""
+        try:
+            document = await asyncio.to_thread(
+                build_document,
+                self.blob_store,
+                email_id=email_id,
+                extracted_data=extracted_data,
+                original_content=original_content,
+                content_type=content_type,
+                subject=subject,
+                sender=sender
+            )
+            result = await self.db.documents.insert_one(document)
+            document_id = str(result.inserted_id)
+            self._invalidate(document_id)
+            await self.increment_stats({"total": 1, "pending": 1})
+
+            logger.info(f"Document stored successfully with ID: {document_id}")
+            return document_id
+        except Exception as e:
+            if "duplicate key error" in str(e):
+                logger.warning(f"Document for email {email_id} already exists, skipping")
+                existing = await self.db.documents.find_one(attachment_query(document), {"_id": 1})
+                return str(existing["_id"]) if existing else None
+            logger.error(f"Error storing document: {str(e)}")
+            raise
+
+    async def get_pending_documents(self, limit: int = 10, view: str = "summary") -> List[Dict[str, Any]]:
+        """Get pending documents, oldest first"""
+        try:
+            cursor = self.db.documents.find(PENDING_QUERY, document_projection(view)).sort(PENDING_SORT).limit(limit)
+            return [serialize_document(doc) for doc in await cursor.to_list(length=limit)]
+        except Exception as e:
+            logger.error(f"Failed to fetch pending documents: {str(e)}")
+            raise
+
+    async def get_document_by_id(self, document_id: str, view: str = "detail") -> Optional[Dict[str, Any]]:
+        """Get a specific document by ID, from the document cache when possible"""
+        if self.document_cache is not None:
+            cached = self.document_cache.get(document_id, view)
+            if cached is not None:
+                return cached
+            generation = self.document_cache.generation()
+        try:
+            doc = await self.db.documents.find_one({"_id": ObjectId(document_id)}, document_projection(view))
+            if not doc:
+                return None
+            document = serialize_document(doc)
+            if self.document_cache is not None:
+                self.document_cache.put(document_id, view, document, generation)
+            return document
+        except Exception as e:
+            logger.error(f"Failed to get document {document_id}: {str(e)}")
+            return None
+
+    async def get_original_content(self, document_id: str) -> Optional[Tuple[bytes, str]]:
+        """Load the original attachment bytes and content type of a document"""
+        doc = await self.db.documents.find_one({"_id": ObjectId(document_id)}, ORIGINAL_PROJECTION)
+        if not doc:
+            return None
+        return await asyncio.to_thread(load_original, self.blob_store, doc)
+
+    async def complete_document_text(self, document_id: str, text: str, pages_processed: Optional[int] = None,
+                                     text_source: Optional[str] = None) -> bool:
+        """Store the full text of a document whose OCR stopped early"""
+        result = await self.db.documents.update_one(
+            {"_id": ObjectId(document_id)},
+            {"$set": build_text_completion(text, pages_processed, text_source)}
+        )
+        self._invalidate(document_id)
+        return result.matched_count > 0
+
+    async def update_document_status(self, doc_id: str, status: str,
+                                     accounting_entry: Optional[Dict] = None,
+                                     corrections: Optional[Dict] = None) -> bool:
+        """Update document status"""
+        try:
+            previous = await self.db.documents.find_one_and_update(
+                {"_id": ObjectId(doc_id)},
+                {"$set": build_status_update(status, accounting_entry, corrections)},
+                projection={"status": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous is None:
+                return False
+            self._invalidate(doc_id)
+            if previous.get("status") != status:
+                await self.increment_stats({previous.get("status"): -1, status: 1})
+            return True
+        except Exception as e:
+            logger.error(f"Failed to update document status: {str(e)}")
+            raise
+
+    async def update_document_statuses_bulk(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply many status updates in one unordered bulk write, with a result per update"""
+        if not updates:
+            return []
+
+        ids = [ObjectId(update["id"]) for update in updates if ObjectId.is_valid(update.get("id"))]
+        current_statuses = {
+            doc["_id"]: doc.get("status")
+            async for doc in self.db.documents.find({"_id": {"$in": ids}}, {"status": 1})
+        }
+        operations, op_items, results = plan_status_updates(updates, current_statuses)
+
+        write_errors = []
+        if operations:
+            try:
+                await self.db.documents.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                logger.error(f"{len(write_errors)} of {len(operations)} status updates failed")
+
+        self._invalidate(*(updates[i]["id"] for i, _, _ in op_items))
+        await self.increment_stats(finish_status_updates(results, op_items, write_errors))
+        return results
+
+    async def search_documents(self, vendor_name: Optional[str] = None,
+                               invoice_number: Optional[str] = None,
+                               date_range: Optional[tuple] = None,
+                               status: Optional[str] = None,
+                               vendor_match: str = "prefix",
+                               view: str = "summary",
+                               limit: int = DEFAULT_PAGE_SIZE,
+                               cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Search documents newest first, one page at a time
+
+        Returns the page and a cursor for the next page (None on the last page).
+        """
+        try:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            query = build_search_query(vendor_name, invoice_number, date_range, status, vendor_match)
+            if cursor:
+                query = {"$and": [query, after_cursor(cursor)]} if query else after_cursor(cursor)
+
+            # One extra document tells whether another page follows
+            docs = await (
+                self.db.documents.find(query, document_projection(view))
+                .sort(SEARCH_SORT)
+                .limit(limit + 1)
+                .to_list(length=limit + 1)
+            )
+            next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+            return [serialize_document(doc) for doc in docs[:limit]], next_cursor
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to search documents: {str(e)}")
+            raise
+
+    async def iter_search_documents(self, vendor_name: Optional[str] = None,
+                                    invoice_number: Optional[str] = None,
+                                    date_range: Optional[tuple] = None,
+                                    status: Optional[str] = None,
+                                    vendor_match: str = "prefix",
+                                    view: str = "summary") -> AsyncIterator[Dict]:
+        """Stream every matching document straight from the Mongo cursor"""
+        query = build_search_query(vendor_name, invoice_number, date_range, status, vendor_match)
+        cursor = self.db.documents.find(query, document_projection(view)).sort(SEARCH_SORT).batch_size(MAX_PAGE_SIZE)
+        try:
+            async for doc in cursor:
+                yield serialize_document(doc)
+        finally:
+            await cursor.close()
+
+    async def increment_stats(self, changes: Dict[str, int]):
+        """Apply count changes to the stats document"""
+        increments = stats_increments(changes)
+        if not increments:
+            return
+        try:
+            await self.db.document_stats.update_one({"_id": STATS_ID}, {"$inc": increments}, upsert=True)
+        except Exception as e:
+            logger.error(f"Failed to update document stats: {str(e)}")
+
+    async def count_document_stats(self) -> Dict[str, int]:
+        """Count documents by status over the whole collection"""
+        return count_by_status(await self.db.documents.aggregate(STATS_PIPELINE).to_list(length=None))
+
+    async def reconcile_stats(self) -> Dict[str, int]:
+        """Recount documents and correct any drift in the stats counters"""
+        try:
+            counted = await self.count_document_stats()
+            await self.db.document_stats.update_one(
+                {"_id": STATS_ID},
+                {"$set": {**counted, "reconciled_at": datetime.utcnow()}},
+                upsert=True
+            )
+            return counted
+        except Exception as e:
+            logger.error(f"Failed to reconcile document stats: {str(e)}")
+            raise
+
+    async def get_document_stats(self) -> Dict[str, int]:
+        """Get document processing statistics from the counters document"""
+        try:
+            stats = await self.db.document_stats.find_one({"_id": STATS_ID})
+            if stats is None:
+                return await self.reconcile_stats()
+            return {field: stats.get(field, 0) for field in STATS_FIELDS}
+        except Exception as e:
+            logger.error(f"Failed to get document stats: {str(e)}")
+            raise
+
+    def close(self):
+        """Close database connection"""
+        if self.client:
+            self.client.close()
+            logger.info("Async database connection closed")
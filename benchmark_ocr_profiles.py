@@ -0,0 +1,106 @@
+import argparse
+import difflib
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+from image_preprocessing import PROFILES, load_image
+
+logging.basicConfig(level=logging.WARNING)
+
+SAMPLE_TEXT = """Tech Solutions Inc.
+123 Market Street, Springfield
+INVOICE
+Invoice Number: INV-2024-001234
+Date: 03/15/2024
+Description Qty Amount
+Cloud hosting 1 $1,250.00
+Support plan 12 $480.00
+Total: $1,730.00
+Payment due within 30 days"""
+
+def synthetic_samples() -> List[Tuple[str, bytes, str]]:
+    """Render the sample invoice as a large colour phone-style JPEG and a 300 DPI scan"""
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 72)
+    except OSError:
+        font = ImageFont.load_default()
+
+    samples = []
+    for name, size, background in (("photo_6000x4000.jpg", (6000, 4000), (236, 228, 205)),
+                                   ("scan_2550x3300.jpg", (2550, 3300), (255, 255, 255))):
+        image = Image.new("RGB", size, background)
+        draw = ImageDraw.Draw(image)
+        draw.multiline_text((size[0] // 10, size[1] // 10), SAMPLE_TEXT, fill=(40, 40, 60), font=font, spacing=36)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        samples.append((name, buffer.getvalue(), SAMPLE_TEXT))
+    return samples
+
+def file_samples(paths: List[str]) -> List[Tuple[str, bytes, str]]:
+    """Load images with their expected text from a .txt file next to each"""
+    samples = []
+    for path in paths:
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(truth_path):
+            print(f"Skipping {path}: no {truth_path} with the expected text")
+            continue
+        with open(path, "rb") as f, open(truth_path, encoding="utf-8") as truth:
+            samples.append((os.path.basename(path), f.read(), truth.read()))
+    return samples
+
+def similarity(expected: str, actual: str) -> float:
+    """Character similarity of two texts, ignoring whitespace differences"""
+    return difflib.SequenceMatcher(None, " ".join(expected.split()), " ".join(actual.split())).ratio()
+
+def run_profile(profile_name: str, samples: List[Tuple[str, bytes, str]], repeat: int) -> dict:
+    """OCR every sample with one profile, timing decode, preprocessing and Tesseract together"""
+    profile = PROFILES[profile_name]
+    latencies = []
+    accuracies = []
+    for _, content, expected in samples:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            text = pytesseract.image_to_string(load_image(content, profile))
+            latencies.append(time.perf_counter() - started)
+        accuracies.append(similarity(expected, text))
+    return {
+        "profile": profile_name,
+        "mean_seconds": statistics.mean(latencies),
+        "max_seconds": max(latencies),
+        "accuracy": statistics.mean(accuracies),
+        "min_accuracy": min(accuracies)
+    }
+
+def main() -> int:
+    """Compare OCR latency and accuracy of each preprocessing profile"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("images", nargs="*", help="images to OCR, each with a .txt file of its expected text")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--repeat", type=int, default=3, help="OCR runs per image")
+    args = parser.parse_args()
+
+    samples = file_samples(args.images) if args.images else synthetic_samples()
+    if not samples:
+        print("No images to benchmark")
+        return 1
+
+    print(f"{len(samples)} images, {args.repeat} runs each\n")
+    print(f"{'profile':<10}  {'mean s':>8}  {'max s':>8}  {'accuracy':>8}  {'worst':>8}")
+    for profile_name in args.profiles:
+        result = run_profile(profile_name, samples, args.repeat)
+        print(
+            f"{result['profile']:<10}  {result['mean_seconds']:>8.3f}  {result['max_seconds']:>8.3f}  "
+            f"{result['accuracy']:>8.1%}  {result['min_accuracy']:>8.1%}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Dict
+
+from bson import ObjectId
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class BlobStore(ABC):
+    """Stores attachment bytes outside the documents collection"""
+
+    backend = "none"
+
+    @abstractmethod
+    def put(self, content: bytes, content_type: str = None) -> Dict[str, Any]:
+        """Store content and return the reference kept on the document"""
+
+    @abstractmethod
+    def get(self, ref: str) -> bytes:
+        """Load content by reference"""
+
+    def describe(self, ref: str, content: bytes) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "ref": ref,
+            "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest()
+        }
+
+class GridFSBlobStore(BlobStore):
+    """Blob store on a GridFS bucket in the application database"""
+
+    backend = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "attachments"):
+        import gridfs
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+        self.files.create_index("filename")
+
+    def put(self, content: bytes, content_type: str = None) -> Dict[str, Any]:
+        sha256 = hashlib.sha256(content).hexdigest()
+        # Identical attachments share one stored file
+        existing = self.files.find_one({"filename": sha256}, {"_id": 1})
+        if existing:
+            file_id = existing["_id"]
+        else:
+            file_id = self.bucket.upload_from_stream(
+                sha256, content, metadata={"content_type": content_type}
+            )
+        return self.describe(str(file_id), content)
+
+    def get(self, ref: str) -> bytes:
+        return self.bucket.open_download_stream(ObjectId(ref)).read()
+
+class LocalBlobStore(BlobStore):
+    """Content-addressed blob store in a local directory"""
+
+    backend = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def put(self, content: bytes, content_type: str = None) -> Dict[str, Any]:
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self._path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(content)
+                os.replace(temp_path, path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+        return self.describe(sha256, content)
+
+    def get(self, ref: str) -> bytes:
+        with open(self._path(ref), 'rb') as f:
+            return f.read()
+
+def create_blob_store(db) -> BlobStore:
+    """Create the blob store selected by BLOB_STORE (gridfs or local)"""
+    backend = os.getenv('BLOB_STORE', 'gridfs').lower()
+    if backend == 'local':
+        root = os.getenv('BLOB_STORE_DIR', 'blobs')
+        logger.info(f"Storing attachments in local blob store at {root}")
+        return LocalBlobStore(root)
+    if backend == 'gridfs':
+        logger.info("Storing attachments in GridFS")
+        return GridFSBlobStore(db)
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
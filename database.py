@@ -1,19 +1,34 @@
-from pymongo import MongoClient
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from pymongo import ASCENDING, DESCENDING, TEXT, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
 import os
 from dotenv import load_dotenv
 import logging
 import certifi
-from bson import ObjectId
+from bson import ObjectId, SON
 from pydantic import BaseModel, Field, ConfigDict
+import base64
 import json
+import re
+import unicodedata
+from blob_store import BlobStore, create_blob_store
+from document_cache import DocumentCache
+from mongo_monitoring import MongoMetrics, client_options
+import threading
+import time
+from concurrent.futures import Future
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DUPLICATE_KEY_ERROR = 11000
+
+# Unique index on (email_id, original.sha256) that makes storing a document idempotent
+ATTACHMENT_INDEX = "email_id_original_sha256"
+
 # Custom JSON encoder to handle ObjectId
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
@@ -23,7 +38,293 @@ class JSONEncoder(json.JSONEncoder):
             return o.isoformat()
         return super().default(o)
 
+# Fields fetched for each named document view. List views never carry the
+# OCR text or attachment bytes; "full" is the raw stored document.
+DOCUMENT_VIEWS: Dict[str, Optional[Dict[str, int]]] = {
+    "summary": {
+        "email_id": 1,
+        "amounts": 1,
+        "dates": 1,
+        "invoice_numbers": 1,
+        "vendor_name": 1,
+        "vendor_key": 1,
+        "content_type": 1,
+        "text_source": 1,
+        "text_complete": 1,
+        "email_subject": 1,
+        "email_sender": 1,
+        "status": 1,
+        "created_at": 1,
+        "updated_at": 1
+    },
+    "detail": {"original_content": 0},
+    "full": None
+}
+
+def document_projection(view: str) -> Optional[Dict[str, int]]:
+    """Get the server-side projection for a named view"""
+    if view not in DOCUMENT_VIEWS:
+        raise ValueError(f"Unknown document view: {view}")
+    return DOCUMENT_VIEWS[view]
+
+def serialize_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Make a fetched document safe for API responses"""
+    doc["_id"] = str(doc["_id"])
+    return doc
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Search results are ordered newest first; _id breaks created_at ties so
+# the (created_at, _id) pair is a stable keyset for pagination
+SEARCH_SORT = [("created_at", -1), ("_id", -1)]
+
+# The review queue: pending documents, oldest first
+PENDING_QUERY = {"status": "pending"}
+PENDING_SORT = [("created_at", ASCENDING)]
+
+def _plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    if "inputStage" in plan:
+        yield from _plan_nodes(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_nodes(child)
+
+# Counters kept in the document_stats collection, maintained with $inc on every write
+STATS_ID = "documents"
+STATS_FIELDS = ("total", "pending", "processed", "error")
+
+def stats_increments(changes: Dict[str, int]) -> Dict[str, int]:
+    """Build a $inc document from count changes, dropping statuses that aren't reported"""
+    return {field: change for field, change in changes.items() if field in STATS_FIELDS and change}
+
+# Trailing words dropped from vendor names, so "Acme Inc." and "ACME, LLC" match
+LEGAL_SUFFIXES = {
+    "llc", "inc", "incorporated", "corp", "corporation", "ltd", "limited", "co", "company",
+    "plc", "llp", "lp", "gmbh", "ag", "sa", "bv", "pty", "pc"
+}
+
+VENDOR_MATCH_MODES = ("prefix", "exact", "text")
+
+def normalize_vendor_name(vendor_name: Optional[str]) -> Optional[str]:
+    """Casefold a vendor name and strip accents, punctuation and legal suffixes"""
+    if vendor_name is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", vendor_name.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    words = re.sub(r"[\W_]+", " ", stripped).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+def build_vendor_query(vendor_name: str, vendor_match: str = "prefix") -> Dict[str, Any]:
+    """Build an indexed vendor filter"""
+    if vendor_match == "text":
+        return {"$text": {"$search": vendor_name}}
+    vendor_key = normalize_vendor_name(vendor_name)
+    if vendor_match == "exact":
+        return {"vendor_key": vendor_key}
+    if vendor_match == "prefix":
+        # An anchored, case-sensitive regex is answered from the index bounds
+        return {"vendor_key": {"$regex": f"^{re.escape(vendor_key)}"}}
+    raise ValueError(f"Unknown vendor match mode: {vendor_match}")
+
+def build_search_query(vendor_name: Optional[str] = None,
+                       invoice_number: Optional[str] = None,
+                       date_range: Optional[tuple] = None,
+                       status: Optional[str] = None,
+                       vendor_match: str = "prefix") -> Dict[str, Any]:
+    """Build the Mongo filter for a document search"""
+    query = {}
+    
+    if vendor_name:
+        query.update(build_vendor_query(vendor_name, vendor_match))
+    if invoice_number:
+        query["invoice_numbers"] = {"$in": [invoice_number]}
+    if status:
+        query["status"] = status
+    if date_range:
+        start_date, end_date = date_range
+        query["created_at"] = {"$gte": start_date, "$lte": end_date}
+    return query
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Encode the keyset position of a document as an opaque cursor"""
+    position = {"created_at": doc["created_at"].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def after_cursor(cursor: str) -> Dict[str, Any]:
+    """Filter for documents that sort after the cursor position"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(position["created_at"])
+        doc_id = ObjectId(position["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": doc_id}}
+        ]
+    }
+
 # Pydantic models with custom JSON serialization
+def build_document(blob_store: BlobStore, *, email_id: str, extracted_data: Dict[str, Any],
+                   original_content: bytes = None, content_type: str = None,
+                   subject: str = None, sender: str = None,
+                   original: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Build the stored form of a processed document, putting its attachment in the blob store
+
+    original is the reference of an attachment already put in the blob store,
+    which callers pass to keep uploads out of bulk writes.
+    """
+    now = datetime.utcnow()
+    if original is None and original_content:
+        original = blob_store.put(original_content, content_type)
+    return {
+        "email_id": str(email_id),
+        "text": extracted_data.get("text", ""),
+        "amounts": extracted_data.get("amounts", []),
+        "dates": extracted_data.get("dates", []),
+        "invoice_numbers": extracted_data.get("invoice_numbers", []),
+        "vendor_name": extracted_data.get("vendor_name"),
+        "vendor_key": normalize_vendor_name(extracted_data.get("vendor_name")),
+        "content_type": content_type or extracted_data.get("content_type", "unknown"),
+        "text_source": extracted_data.get("text_source"),
+        "pages_total": extracted_data.get("pages_total"),
+        "pages_processed": extracted_data.get("pages_processed"),
+        "text_complete": extracted_data.get("text_complete", True),
+        # Kept until the skipped pages are OCR'd and spliced into the text
+        "skipped_pages": extracted_data.get("skipped_pages", []),
+        "page_offsets": extracted_data.get("page_offsets"),
+        "original": original,
+        "email_subject": subject,
+        "email_sender": sender,
+        "status": "pending",
+        "created_at": now,
+        "updated_at": now
+    }
+
+def attachment_query(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Match the stored document of the same attachment of the same email"""
+    return {"email_id": document["email_id"], "original.sha256": (document.get("original") or {}).get("sha256")}
+
+def build_text_completion(text: str, pages_processed: Optional[int], text_source: Optional[str]) -> Dict[str, Any]:
+    """Build the $set document that replaces early exit text with the full text"""
+    return {
+        "text": text,
+        "pages_processed": pages_processed,
+        "text_complete": True,
+        "text_source": text_source,
+        "skipped_pages": [],
+        "page_offsets": None,
+        "updated_at": datetime.utcnow()
+    }
+
+def build_status_update(status: str, accounting_entry: Optional[Dict] = None,
+                        corrections: Optional[Dict] = None) -> Dict[str, Any]:
+    """Build the $set document of a status update"""
+    update_data = {
+        "status": status,
+        "updated_at": datetime.utcnow()
+    }
+    
+    if accounting_entry:
+        update_data["accounting_entry"] = accounting_entry
+    if corrections:
+        update_data["corrections"] = corrections
+    return update_data
+
+# Fields needed to load a document's original attachment
+ORIGINAL_PROJECTION = {"original": 1, "original_content": 1, "content_type": 1}
+
+def load_original(blob_store: BlobStore, doc: Dict[str, Any]) -> Optional[Tuple[bytes, str]]:
+    """Load the original attachment bytes and content type of a fetched document"""
+    content_type = doc.get("content_type") or "application/octet-stream"
+    if doc.get("original"):
+        original = doc["original"]
+        if original["backend"] != blob_store.backend:
+            raise ValueError(f"Document stored in {original['backend']} blob store, but {blob_store.backend} is configured")
+        return blob_store.get(original["ref"]), content_type
+    # Documents stored before the blob store embed their content
+    if doc.get("original_content"):
+        return bytes(doc["original_content"]), content_type
+    return None
+
+def count_by_status(results: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Fold $group counts by status into the reported stats"""
+    stats = {field: 0 for field in STATS_FIELDS}
+    for result in results:
+        status = result["_id"]
+        count = result["count"]
+        if status in stats:
+            stats[status] = count
+        stats["total"] += count
+    return stats
+
+STATS_PIPELINE = [
+    {
+        "$group": {
+            "_id": "$status",
+            "count": {"$sum": 1}
+        }
+    }
+]
+
+# Upper bound on updates accepted in one bulk status request
+MAX_BULK_STATUS_UPDATES = 1000
+
+def plan_status_updates(updates: List[Dict[str, Any]],
+                        current_statuses: Dict[ObjectId, str]) -> Tuple[List[UpdateOne], List[tuple], List[Dict[str, Any]]]:
+    """Turn bulk status updates into write operations and per-item results
+
+    Returns the operations, an (item index, previous status, new status)
+    entry per operation, and the results with missing or invalid ids
+    already filled in. An unordered bulk write doesn't apply operations in
+    order, so only the last update of each document is written and the
+    earlier ones are reported as superseded.
+    """
+    last_index = {
+        ObjectId(update["id"]): i
+        for i, update in enumerate(updates)
+        if ObjectId.is_valid(update.get("id"))
+    }
+    operations = []
+    op_items = []
+    results = []
+    for i, update in enumerate(updates):
+        result = {"index": i, "id": update.get("id"), "status": "updated"}
+        results.append(result)
+        if not ObjectId.is_valid(update.get("id")):
+            result["status"] = "invalid_id"
+            continue
+        oid = ObjectId(update["id"])
+        if oid not in current_statuses:
+            result["status"] = "not_found"
+            continue
+        if last_index[oid] != i:
+            result["status"] = "superseded"
+            result["superseded_by"] = last_index[oid]
+            continue
+        update_data = build_status_update(update["status"], update.get("accounting_entry"), update.get("corrections"))
+        operations.append(UpdateOne({"_id": oid}, {"$set": update_data}))
+        op_items.append((i, current_statuses[oid], update["status"]))
+    return operations, op_items, results
+
+def finish_status_updates(results: List[Dict[str, Any]], op_items: List[tuple],
+                          write_errors: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Mark failed operations in the results and return the stats changes of the rest"""
+    failed = {error["index"]: error.get("errmsg") for error in write_errors}
+    changes: Dict[str, int] = {}
+    for op_index, (i, previous, status) in enumerate(op_items):
+        if op_index in failed:
+            results[i]["status"] = "error"
+            results[i]["error"] = failed[op_index]
+        elif previous != status:
+            changes[previous] = changes.get(previous, 0) - 1
+            changes[status] = changes.get(status, 0) + 1
+    return changes
+
 class PyObjectId(ObjectId):
     @classmethod
     def __get_validators__(cls):
@@ -49,6 +350,7 @@ class DocumentModel(BaseModel):
     vendor_name: Optional[str]
     content_type: str
     original_content: Optional[bytes] = None
+    original: Optional[Dict[str, Any]] = None
     email_subject: Optional[str] = None
     email_sender: Optional[str] = None
     status: str = "pending"
@@ -62,9 +364,17 @@ class DocumentModel(BaseModel):
     )
 
 class Database:
-    def __init__(self):
+    def __init__(self, document_cache: Optional[DocumentCache] = None, metrics: Optional[MongoMetrics] = None):
         self.client = None
         self.db = None
+        self.blob_store: Optional[BlobStore] = None
+        self.document_cache = document_cache
+        self.metrics = metrics
+
+    def _invalidate(self, *document_ids: str):
+        if self.document_cache is not None:
+            for document_id in document_ids:
+                self.document_cache.invalidate(document_id)
 
     def connect(self):
         """Connect to MongoDB"""
@@ -76,8 +386,10 @@ class Database:
                 raise ValueError("Missing MONGODB_URI in environment variables")
             
             # Use certifi for SSL certificate verification
-            self.client = MongoClient(mongo_url, tlsCAFile=certifi.where())
+            self.client = MongoClient(mongo_url, tlsCAFile=certifi.where(), **client_options(self.metrics))
             self.db = self.client.accounting_automation
+            # Attachment bytes live outside the documents collection
+            self.blob_store = create_blob_store(self.db)
             
             # Test connection
             self.client.admin.command('ping')
@@ -91,46 +403,165 @@ class Database:
             raise
 
     def create_indexes(self):
-        """Create necessary indexes"""
+        """Create indexes matched to the query shapes of this class"""
         try:
-            self.db.documents.create_index("status")
-            self.db.documents.create_index("created_at")
-            self.db.documents.create_index("vendor_name")
+            # Search by status, newest first, paginated on (created_at, _id)
+            self.db.documents.create_index(
+                [("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="status_created_at_id"
+            )
+            # Unfiltered and date-range searches
+            self.db.documents.create_index(
+                [("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="created_at_id"
+            )
+            # The review queue only ever reads pending documents
+            self.db.documents.create_index(
+                [("created_at", ASCENDING)],
+                name="pending_created_at",
+                partialFilterExpression={"status": "pending"}
+            )
+            # Multikey index for invoice number lookups
+            self.db.documents.create_index(
+                [("invoice_numbers", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="invoice_numbers_created_at_id"
+            )
+            # Vendor prefix and exact lookups on the normalized key
+            self.db.documents.create_index(
+                [("vendor_key", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="vendor_key_created_at_id"
+            )
+            self.db.documents.create_index([("vendor_name", TEXT)], name="vendor_name_text")
             self.db.documents.create_index("email_id")
+            self.create_attachment_index()
             logger.info("Database indexes created successfully")
         except Exception as e:
             logger.error(f"Failed to create indexes: {str(e)}")
             raise
 
+    def create_attachment_index(self):
+        """Allow one document per attachment of an email
+
+        An ingestion pass retried after a partial failure then gets its
+        already stored documents back as duplicates instead of inserting them
+        again. Documents without an original attachment are not covered.
+        """
+        try:
+            self.db.documents.create_index(
+                [("email_id", ASCENDING), ("original.sha256", ASCENDING)],
+                name=ATTACHMENT_INDEX,
+                unique=True,
+                partialFilterExpression={"original.sha256": {"$exists": True}}
+            )
+        except OperationFailure as e:
+            if e.code != DUPLICATE_KEY_ERROR:
+                raise
+            logger.warning(
+                f"Documents stored twice for the same attachment prevent the {ATTACHMENT_INDEX} index; "
+                f"retried emails may be stored again until they are removed: {str(e)}"
+            )
+
+    def query_shapes(self) -> List[Dict[str, Any]]:
+        """Representative find() calls for every query method, used by explain_queries"""
+        sample = self.db.documents.find_one(
+            {"invoice_numbers.0": {"$exists": True}},
+            {"vendor_name": 1, "invoice_numbers": 1, "created_at": 1}
+        ) or {}
+        vendor_name = sample.get("vendor_name") or "Acme"
+        invoice_number = (sample.get("invoice_numbers") or ["INV-2024-0001"])[0]
+        end = sample.get("created_at") or datetime.utcnow()
+        date_range = (end - timedelta(days=30), end)
+
+        searches = {
+            "search_documents(status)": build_search_query(status="pending"),
+            "search_documents(vendor_name prefix)": build_search_query(vendor_name=vendor_name[:4]),
+            "search_documents(vendor_name exact)": build_search_query(vendor_name=vendor_name, vendor_match="exact"),
+            "search_documents(vendor_name text)": build_search_query(vendor_name=vendor_name, vendor_match="text"),
+            "search_documents(invoice_number)": build_search_query(invoice_number=invoice_number),
+            "search_documents(date_range)": build_search_query(date_range=date_range),
+            "search_documents(status, date_range)": build_search_query(status="processed", date_range=date_range),
+            "search_documents()": build_search_query()
+        }
+        shapes = [
+            {"name": "get_pending_documents", "filter": PENDING_QUERY, "sort": PENDING_SORT, "limit": 10},
+            {"name": "get_document_by_id", "filter": {"_id": sample.get("_id", ObjectId())}}
+        ]
+        shapes.extend(
+            {"name": name, "filter": query, "sort": SEARCH_SORT, "limit": DEFAULT_PAGE_SIZE + 1}
+            for name, query in searches.items()
+        )
+        return shapes
+
+    def explain_queries(self) -> List[Dict[str, Any]]:
+        """Explain every query shape and flag the ones that scan the whole collection"""
+        report = []
+        for shape in self.query_shapes():
+            command = {"find": "documents", "filter": shape["filter"]}
+            if shape.get("sort"):
+                command["sort"] = SON(shape["sort"])
+            if shape.get("limit"):
+                command["limit"] = shape["limit"]
+            explain = self.db.command("explain", command, verbosity="executionStats")
+
+            # Newer servers wrap the classic plan in a queryPlan node
+            plan = explain["queryPlanner"]["winningPlan"]
+            nodes = list(_plan_nodes(plan.get("queryPlan", plan)))
+            stages = [node["stage"] for node in nodes if "stage" in node]
+            stats = explain.get("executionStats", {})
+            report.append({
+                "query": shape["name"],
+                "stages": stages,
+                "indexes": sorted({node["indexName"] for node in nodes if "indexName" in node}),
+                "keys_examined": stats.get("totalKeysExamined"),
+                "docs_examined": stats.get("totalDocsExamined"),
+                "returned": stats.get("nReturned"),
+                "collscan": "COLLSCAN" in stages,
+                "in_memory_sort": "SORT" in stages
+            })
+        return report
+
+    def build_document(self, *, email_id: str, extracted_data: Dict[str, Any],
+                       original_content: bytes = None, content_type: str = None,
+                       subject: str = None, sender: str = None,
+                       original: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the stored form of a processed document"""
+        return build_document(
+            self.blob_store,
+            email_id=email_id,
+            extracted_data=extracted_data,
+            original_content=original_content,
+            content_type=content_type,
+            subject=subject,
+            sender=sender,
+            original=original
+        )
+
     def store_document(self, *, email_id: str, extracted_data: Dict[str, Any], 
                       original_content: bytes = None, content_type: str = None, 
-                      subject: str = None, sender: str = None) -> str:
-        """Store a processed document"""
+                      subject: str = None, sender: str = None,
+                      original: Optional[Dict[str, Any]] = None) -> str:
+        """Store a processed document, or get the id of the one already stored for its attachment"""
         try:
             logger.info(f"Preparing to store document from email {email_id}")
             
             # Create document dictionary
-            document = {
-                "email_id": str(email_id),
-                "text": extracted_data.get("text", ""),
-                "amounts": extracted_data.get("amounts", []),
-                "dates": extracted_data.get("dates", []),
-                "invoice_numbers": extracted_data.get("invoice_numbers", []),
-                "vendor_name": extracted_data.get("vendor_name"),
-                "content_type": content_type or extracted_data.get("content_type", "unknown"),
-                "original_content": original_content,
-                "email_subject": subject,
-                "email_sender": sender,
-                "status": "pending",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
+            document = self.build_document(
+                email_id=email_id,
+                extracted_data=extracted_data,
+                original_content=original_content,
+                content_type=content_type,
+                subject=subject,
+                sender=sender,
+                original=original
+            )
             
-            logger.info(f"Document prepared with vendor: {document['vendor_name']}, amounts: {document['amounts']}")
+            logger.debug(f"Document prepared with vendor: {document['vendor_name']}, amounts: {document['amounts']}")
             
             # Insert document and get the result
             result = self.db.documents.insert_one(document)
             document_id = str(result.inserted_id)
+            self._invalidate(document_id)
+            self.increment_stats({"total": 1, "pending": 1})
             
             logger.info(f"Document stored successfully with ID: {document_id}")
             return document_id
@@ -138,123 +569,284 @@ class Database:
         except Exception as e:
             if "duplicate key error" in str(e):
                 logger.warning(f"Document for email {email_id} already exists, skipping")
-                return None
+                existing = self.db.documents.find_one(attachment_query(document), {"_id": 1})
+                return str(existing["_id"]) if existing else None
             else:
                 logger.error(f"Error storing document: {str(e)}")
                 raise
 
-    def get_pending_documents(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get pending documents"""
+    def store_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Store many processed documents in one unordered insert, with a result per document
+
+        Each item takes the keyword arguments of store_document. Items should
+        carry an already uploaded original, or each attachment is put in the
+        blob store one at a time here.
+        """
+        if not documents:
+            return []
+
+        prepared = [self.build_document(**document) for document in documents]
+        for document in prepared:
+            document["_id"] = ObjectId()
+        results = [
+            {"index": i, "email_id": document["email_id"], "document_id": str(document["_id"]), "status": "inserted"}
+            for i, document in enumerate(prepared)
+        ]
+
+        try:
+            self.db.documents.insert_many(prepared, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                result = results[error["index"]]
+                result["document_id"] = None
+                if error.get("code") == DUPLICATE_KEY_ERROR:
+                    result["status"] = "duplicate"
+                    logger.warning(f"Document for email {result['email_id']} already exists, skipping")
+                else:
+                    result["status"] = "error"
+                    result["error"] = error.get("errmsg")
+                    logger.error(f"Error storing document from email {result['email_id']}: {error.get('errmsg')}")
+
+        inserted = sum(1 for result in results if result["status"] == "inserted")
+        self._invalidate(*(result["document_id"] for result in results if result["status"] == "inserted"))
+        self.increment_stats({"total": inserted, "pending": inserted})
+        logger.info(f"Bulk stored {inserted} of {len(results)} documents")
+        return results
+
+    def backfill_vendor_keys(self, batch_size: int = 1000) -> int:
+        """Set vendor_key on documents stored before it existed"""
+        updated = 0
+        operations = []
+        cursor = self.db.documents.find({"vendor_key": {"$exists": False}}, {"vendor_name": 1}).batch_size(batch_size)
+        for doc in cursor:
+            operations.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"vendor_key": normalize_vendor_name(doc.get("vendor_name"))}}
+            ))
+            if len(operations) >= batch_size:
+                updated += self.db.documents.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += self.db.documents.bulk_write(operations, ordered=False).modified_count
+        if self.document_cache is not None:
+            self.document_cache.clear()
+        logger.info(f"Backfilled vendor_key on {updated} documents")
+        return updated
+
+    def get_pending_documents(self, limit: int = 10, view: str = "summary") -> List[Dict[str, Any]]:
+        """Get pending documents, oldest first"""
         try:
             logger.info(f"Fetching up to {limit} pending documents")
-            cursor = self.db.documents.find({"status": "pending"}).limit(limit)
-            documents = []
+            cursor = self.db.documents.find(PENDING_QUERY, document_projection(view)).sort(PENDING_SORT).limit(limit)
+            documents = [serialize_document(doc) for doc in cursor]
             
-            for doc in cursor:
-                # Convert ObjectId to string and remove binary content for API response
-                doc["_id"] = str(doc["_id"])
-                if "original_content" in doc:
-                    doc["original_content"] = None  # Don't send binary data in API
-                documents.append(doc)
-                
             logger.info(f"Found {len(documents)} pending documents")
             return documents
         except Exception as e:
             logger.error(f"Failed to fetch pending documents: {str(e)}")
             raise
 
-    def get_document_by_id(self, document_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific document by ID"""
+    def get_document_by_id(self, document_id: str, view: str = "detail") -> Optional[Dict[str, Any]]:
+        """Get a specific document by ID, from the document cache when possible"""
+        if self.document_cache is not None:
+            cached = self.document_cache.get(document_id, view)
+            if cached is not None:
+                return cached
+            generation = self.document_cache.generation()
         try:
-            doc = self.db.documents.find_one({"_id": ObjectId(document_id)})
-            if doc:
-                doc["_id"] = str(doc["_id"])
-                if "original_content" in doc:
-                    doc["original_content"] = None  # Don't send binary data in API
-            return doc
+            doc = self.db.documents.find_one({"_id": ObjectId(document_id)}, document_projection(view))
+            if not doc:
+                return None
+            document = serialize_document(doc)
+            if self.document_cache is not None:
+                self.document_cache.put(document_id, view, document, generation)
+            return document
         except Exception as e:
             logger.error(f"Failed to get document {document_id}: {str(e)}")
             return None
 
+    def get_original_content(self, document_id: str) -> Optional[Tuple[bytes, str]]:
+        """Load the original attachment bytes and content type of a document"""
+        doc = self.db.documents.find_one({"_id": ObjectId(document_id)}, ORIGINAL_PROJECTION)
+        if not doc:
+            return None
+        return load_original(self.blob_store, doc)
+
+    def complete_document_text(self, document_id: str, text: str, pages_processed: Optional[int] = None,
+                               text_source: Optional[str] = None) -> bool:
+        """Store the full text of a document whose OCR stopped early"""
+        result = self.db.documents.update_one(
+            {"_id": ObjectId(document_id)},
+            {"$set": build_text_completion(text, pages_processed, text_source)}
+        )
+        self._invalidate(document_id)
+        return result.matched_count > 0
+
+    def migrate_original_content(self, batch_size: int = 100) -> int:
+        """Move embedded original_content of older documents into the blob store"""
+        migrated = 0
+        cursor = self.db.documents.find(
+            {"original_content": {"$ne": None}},
+            {"original_content": 1, "content_type": 1}
+        ).batch_size(batch_size)
+        for doc in cursor:
+            original = self.blob_store.put(bytes(doc["original_content"]), doc.get("content_type"))
+            self.db.documents.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"original": original}, "$unset": {"original_content": ""}}
+            )
+            migrated += 1
+        if self.document_cache is not None:
+            self.document_cache.clear()
+        logger.info(f"Moved original content of {migrated} documents to the blob store")
+        return migrated
+
     def update_document_status(self, doc_id: str, status: str, 
                              accounting_entry: Optional[Dict] = None,
                              corrections: Optional[Dict] = None) -> bool:
         """Update document status"""
         try:
-            update_data = {
-                "status": status,
-                "updated_at": datetime.utcnow()
-            }
-            
-            if accounting_entry:
-                update_data["accounting_entry"] = accounting_entry
-            if corrections:
-                update_data["corrections"] = corrections
-                
-            result = self.db.documents.update_one(
+            update_data = build_status_update(status, accounting_entry, corrections)
+
+            # The previous status tells which counters to move
+            previous = self.db.documents.find_one_and_update(
                 {"_id": ObjectId(doc_id)},
-                {"$set": update_data}
+                {"$set": update_data},
+                projection={"status": 1},
+                return_document=ReturnDocument.BEFORE
             )
-            return result.modified_count > 0
+            if previous is None:
+                return False
+            self._invalidate(doc_id)
+            if previous.get("status") != status:
+                self.increment_stats({previous.get("status"): -1, status: 1})
+            return True
         except Exception as e:
             logger.error(f"Failed to update document status: {str(e)}")
             raise
 
+    def update_document_statuses_bulk(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply many status updates in one unordered bulk write, with a result per update
+
+        Each item has an id and status, plus optional accounting_entry and corrections.
+        When an id appears more than once the last item wins and the others
+        come back as superseded.
+        """
+        if not updates:
+            return []
+
+        ids = [ObjectId(update["id"]) for update in updates if ObjectId.is_valid(update.get("id"))]
+        current_statuses = {
+            doc["_id"]: doc.get("status")
+            for doc in self.db.documents.find({"_id": {"$in": ids}}, {"status": 1})
+        }
+        operations, op_items, results = plan_status_updates(updates, current_statuses)
+
+        write_errors = []
+        if operations:
+            try:
+                self.db.documents.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                logger.error(f"{len(write_errors)} of {len(operations)} status updates failed")
+
+        self._invalidate(*(updates[i]["id"] for i, _, _ in op_items))
+        self.increment_stats(finish_status_updates(results, op_items, write_errors))
+        updated = sum(1 for result in results if result["status"] == "updated")
+        logger.info(f"Bulk updated status of {updated} of {len(results)} documents")
+        return results
+
     def search_documents(self, vendor_name: Optional[str] = None,
                         invoice_number: Optional[str] = None,
                         date_range: Optional[tuple] = None,
-                        status: Optional[str] = None) -> List[Dict]:
-        """Search documents based on criteria"""
+                        status: Optional[str] = None,
+                        vendor_match: str = "prefix",
+                        view: str = "summary",
+                        limit: int = DEFAULT_PAGE_SIZE,
+                        cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Search documents newest first, one page at a time
+
+        Returns the page and a cursor for the next page (None on the last page).
+        """
         try:
-            query = {}
-            
-            if vendor_name:
-                query["vendor_name"] = {"$regex": vendor_name, "$options": "i"}
-            if invoice_number:
-                query["invoice_numbers"] = {"$in": [invoice_number]}
-            if status:
-                query["status"] = status
-            if date_range:
-                start_date, end_date = date_range
-                query["created_at"] = {"$gte": start_date, "$lte": end_date}
-                
-            cursor = self.db.documents.find(query)
-            documents = []
-            
-            for doc in cursor:
-                doc["_id"] = str(doc["_id"])
-                if "original_content" in doc:
-                    doc["original_content"] = None  # Don't send binary data in API
-                documents.append(doc)
-                
-            return documents
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            query = build_search_query(vendor_name, invoice_number, date_range, status, vendor_match)
+            if cursor:
+                query = {"$and": [query, after_cursor(cursor)]} if query else after_cursor(cursor)
+
+            # One extra document tells whether another page follows
+            docs = list(
+                self.db.documents.find(query, document_projection(view))
+                .sort(SEARCH_SORT)
+                .limit(limit + 1)
+            )
+            next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+            return [serialize_document(doc) for doc in docs[:limit]], next_cursor
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Failed to search documents: {str(e)}")
             raise
 
+    def iter_search_documents(self, vendor_name: Optional[str] = None,
+                              invoice_number: Optional[str] = None,
+                              date_range: Optional[tuple] = None,
+                              status: Optional[str] = None,
+                              vendor_match: str = "prefix",
+                              view: str = "summary") -> Iterator[Dict]:
+        """Stream every matching document straight from the Mongo cursor"""
+        query = build_search_query(vendor_name, invoice_number, date_range, status, vendor_match)
+        cursor = self.db.documents.find(query, document_projection(view)).sort(SEARCH_SORT).batch_size(MAX_PAGE_SIZE)
+        try:
+            for doc in cursor:
+                yield serialize_document(doc)
+        finally:
+            cursor.close()
+
+    def increment_stats(self, changes: Dict[str, int]):
+        """Apply count changes to the stats document"""
+        increments = stats_increments(changes)
+        if not increments:
+            return
+        try:
+            self.db.document_stats.update_one({"_id": STATS_ID}, {"$inc": increments}, upsert=True)
+        except Exception as e:
+            # The document write already succeeded; reconciliation repairs the counters
+            logger.error(f"Failed to update document stats: {str(e)}")
+
+    def count_document_stats(self) -> Dict[str, int]:
+        """Count documents by status over the whole collection"""
+        return count_by_status(self.db.documents.aggregate(STATS_PIPELINE))
+
+    def reconcile_stats(self) -> Dict[str, int]:
+        """Recount documents and correct any drift in the stats counters
+
+        Writes that land between the count and the correction are not
+        reflected until the next reconciliation.
+        """
+        try:
+            counted = self.count_document_stats()
+            previous = self.db.document_stats.find_one_and_update(
+                {"_id": STATS_ID},
+                {"$set": {**counted, "reconciled_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            ) or {}
+            drift = {field: counted[field] - previous.get(field, 0) for field in STATS_FIELDS}
+            if any(drift.values()):
+                logger.warning(f"Corrected document stats drift: {drift}")
+            return counted
+        except Exception as e:
+            logger.error(f"Failed to reconcile document stats: {str(e)}")
+            raise
+
     def get_document_stats(self) -> Dict[str, int]:
-        """Get document processing statistics"""
+        """Get document processing statistics from the counters document"""
         try:
-            pipeline = [
-                {
-                    "$group": {
-                        "_id": "$status",
-                        "count": {"$sum": 1}
-                    }
-                }
-            ]
-            
-            cursor = self.db.documents.aggregate(pipeline)
-            stats = {"total": 0, "pending": 0, "processed": 0, "error": 0}
-            
-            for result in cursor:
-                status = result["_id"]
-                count = result["count"]
-                if status in stats:
-                    stats[status] = count
-                stats["total"] += count
-                
-            return stats
+            stats = self.db.document_stats.find_one({"_id": STATS_ID})
+            if stats is None:
+                return self.reconcile_stats()
+            return {field: stats.get(field, 0) for field in STATS_FIELDS}
         except Exception as e:
             logger.error(f"Failed to get document stats: {str(e)}")
             raise
@@ -263,4 +855,91 @@ class Database:
         """Close database connection"""
         if self.client:
             self.client.close()
-            logger.info("Database connection closed") 
\ No newline at end of file
+            logger.info("Database connection closed")
+
+
+class DocumentWriteBuffer:
+    """Write-behind buffer that stores documents in bulk once a size or age threshold is reached"""
+
+    def __init__(self, database: Database, max_size: Optional[int] = None, max_delay: Optional[float] = None):
+        self.database = database
+        self.max_size = max_size or int(os.getenv('DOCUMENT_BUFFER_SIZE', '500'))
+        self.max_delay = max_delay or float(os.getenv('DOCUMENT_BUFFER_DELAY', '2.0'))
+        self._pending: List[Tuple[Dict[str, Any], Future]] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._inserted = 0
+        self._duplicates = 0
+        self._errors = 0
+        self._flushes = 0
+        self._thread = threading.Thread(target=self._flush_periodically, name='document-buffer', daemon=True)
+        self._thread.start()
+
+    def add(self, **document) -> Future:
+        """Queue a document (store_document keyword arguments); the future resolves to its bulk result"""
+        future = Future()
+        with self._lock:
+            self._pending.append((document, future))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._pending) >= self.max_size
+        if full:
+            self.flush()
+        return future
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Write every buffered document now"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._oldest = None
+            if not batch:
+                return []
+
+            try:
+                results = self.database.store_documents_bulk([document for document, _ in batch])
+            except Exception as e:
+                logger.error(f"Bulk store of {len(batch)} documents failed: {str(e)}")
+                with self._lock:
+                    self._errors += len(batch)
+                for _, future in batch:
+                    future.set_exception(e)
+                return []
+
+            with self._lock:
+                self._flushes += 1
+                for result in results:
+                    if result["status"] == "inserted":
+                        self._inserted += 1
+                    elif result["status"] == "duplicate":
+                        self._duplicates += 1
+                    else:
+                        self._errors += 1
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            return results
+
+    def _flush_periodically(self):
+        while not self._stop.wait(min(self.max_delay, 1.0)):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+            if due:
+                self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get buffer depth and write counters"""
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "flushes": self._flushes,
+                "inserted": self._inserted,
+                "duplicates": self._duplicates,
+                "errors": self._errors
+            }
+
+    def close(self):
+        """Stop the background flusher and write what is left"""
+        self._stop.set()
+        self.flush()
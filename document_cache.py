@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class DocumentCache:
+    """Bounded LRU cache of fetched documents, keyed by id and view, with a TTL"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv('DOCUMENT_CACHE_SIZE', '1024'))
+        # The TTL bounds staleness from writes made by other processes
+        self.ttl = ttl or float(os.getenv('DOCUMENT_CACHE_TTL', '30'))
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        # Reads that started before an invalidation of their document must not
+        # be cached, so every invalidation is stamped from one counter
+        self._generation = 0
+        self._invalidated_at: "OrderedDict[str, int]" = OrderedDict()
+        # Stamp of the newest invalidation no longer tracked per document
+        self._forgotten = 0
+        self._stop = threading.Event()
+        self._watch_thread = None
+
+    def get(self, document_id: str, view: str) -> Optional[Dict[str, Any]]:
+        """Get a cached document, or None if it isn't cached or has expired"""
+        key = (document_id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() < entry[0]:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def generation(self) -> int:
+        """Token to take before reading a document from the database and pass to put()"""
+        with self._lock:
+            return self._generation
+
+    def put(self, document_id: str, view: str, document: Dict[str, Any], generation: Optional[int] = None):
+        """Cache a fetched document, unless it was invalidated after the read's generation token"""
+        key = (document_id, view)
+        with self._lock:
+            if generation is not None and self._invalidated_at.get(document_id, self._forgotten) > generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, dict(document))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document_id: str):
+        """Drop every cached view of a document"""
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at[document_id] = self._generation
+            self._invalidated_at.move_to_end(document_id)
+            while len(self._invalidated_at) > self.max_entries:
+                _, self._forgotten = self._invalidated_at.popitem(last=False)
+            stale = [key for key in self._entries if key[0] == document_id]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._invalidations += 1
+
+    def clear(self):
+        """Drop every cached document"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidated_at.clear()
+            self._forgotten = self._generation
+
+    def watch(self, collection):
+        """Invalidate documents changed by any process, following a Mongo change stream
+
+        Needs a replica set or Atlas cluster. Runs in a background thread and
+        reopens the stream after errors, clearing the cache since changes may
+        have been missed in between.
+        """
+        if self._watch_thread:
+            return
+
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    with collection.watch(pipeline) as stream:
+                        while not self._stop.is_set():
+                            change = stream.try_next()
+                            if change is None:
+                                self._stop.wait(1.0)
+                                continue
+                            self.invalidate(str(change["documentKey"]["_id"]))
+                except Exception as e:
+                    logger.warning(f"Document cache change stream failed: {str(e)}")
+                    self.clear()
+                    self._stop.wait(5.0)
+
+        self._watch_thread = threading.Thread(target=loop, name='document-cache-watch', daemon=True)
+        self._watch_thread.start()
+        logger.info("Watching the documents collection for cache invalidation")
+
+    def close(self):
+        """Stop the change stream thread"""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit and miss counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "watching": self._watch_thread is not None
+            }
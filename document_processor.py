@@ -1,174 +1,275 @@
 import pytesseract
-from PIL import Image
-import pdf2image
-import io
 import re
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 import logging
 from datetime import datetime
-import tempfile
 import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from extraction_scanner import (
+    AMOUNT_PATTERNS, DATE_PATTERNS, INVOICE_PATTERNS, MIN_STANDALONE_INVOICE_LENGTH,
+    STANDALONE_INVOICE_PATTERNS, ExtractionScanner
+)
+from image_preprocessing import get_profile, load_image, preprocess
+from pdf_rendering import pdf_page_count, read_text_layer, render_page
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump whenever a change to OCR settings would change extracted text,
+# so cached OCR results from the old configuration stop matching
+OCR_CONFIG_VERSION = "2"
+
+# Labels that mark an amount as the invoice total rather than a line item
+TOTAL_LABEL = re.compile(r'(?i)\b(?:total|amount due|balance due|balance)\b')
+
+class OCRTimeoutError(Exception):
+    """The deadline of an OCR job passed before its text was extracted"""
+
 class DocumentProcessor:
     def __init__(self):
         logger.info("Initializing DocumentProcessor")
-        # Improved patterns for better accuracy
-        self.amount_patterns = [
-            r'\$\s*\d{1,3}(?:,\d{3})*(?:\.\d{2})',  # $1,234.56 format
-            r'\$\s*\d+\.\d{2}',  # $123.45 format
-            r'(?:Total|Amount|Due|Balance)[\s:]*\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',  # Context-aware amounts
-            r'(?:USD|CAD)?\s*\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2}))',  # Currency prefixed amounts
-        ]
-        
-        self.date_patterns = [
-            r'\d{1,2}/\d{1,2}/\d{4}',  # MM/DD/YYYY or M/D/YYYY
-            r'\d{1,2}-\d{1,2}-\d{4}',  # MM-DD-YYYY or M-D-YYYY
-            r'\d{4}-\d{1,2}-\d{1,2}',  # YYYY-MM-DD or YYYY-M-D
-            r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',  # Full month names
-            r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}'  # Abbreviated month names
-        ]
-        
-        self.invoice_patterns = [
-            r'(?i)invoice\s*#?\s*:?\s*([A-Z]{2,4}-\d{4}-\d{4,6})',  # INV-2024-123456 format
-            r'(?i)inv\s*#?\s*:?\s*([A-Z]{2,4}-\d{4}-\d{4,6})',     # INV-2024-123456 format
-            r'(?i)invoice\s*(?:number|no|#)\s*:?\s*([A-Z0-9-]{6,})', # Invoice Number: ABC-123
-            r'(?i)bill\s*#?\s*:?\s*([A-Z0-9-]{6,})',               # Bill # ABC-123
-            r'(?i)reference\s*#?\s*:?\s*([A-Z0-9-]{6,})',          # Reference # ABC-123
+        # Monotonic time the current job must finish by (None = no limit).
+        # Every render and Tesseract call only gets the time that is left.
+        self.deadline: Optional[float] = None
+        # Pages of a single PDF rendered and OCR'd concurrently
+        self.page_workers = int(os.getenv('OCR_PAGE_WORKERS', str(os.cpu_count() or 1)))
+        # Grayscale, downscale and binarize settings applied before Tesseract
+        self.profile = get_profile()
+        # Use the embedded text of digitally generated PDFs instead of OCR
+        self.use_text_layer = os.getenv('PDF_TEXT_LAYER', 'true').lower() == 'true'
+        # Pages with fewer letters and digits than this in their text layer are OCR'd
+        self.text_layer_min_chars = int(os.getenv('PDF_TEXT_LAYER_MIN_CHARS', '20'))
+        # Stop OCRing a PDF once the required fields are found with enough confidence
+        self.early_exit = os.getenv('OCR_EARLY_EXIT', 'false').lower() == 'true'
+        self.early_exit_fields = [
+            field.strip()
+            for field in os.getenv('OCR_EARLY_EXIT_FIELDS', 'vendor_name,invoice_numbers,dates,amounts').split(',')
+            if field.strip()
         ]
+        self.early_exit_confidence = float(os.getenv('OCR_EARLY_EXIT_CONFIDENCE', '0.8'))
+        # Extraction patterns, defined in extraction_scanner
+        self.amount_patterns = list(AMOUNT_PATTERNS)
+        self.date_patterns = list(DATE_PATTERNS)
+        self.invoice_patterns = list(INVOICE_PATTERNS)
+        self.standalone_invoice_patterns = list(STANDALONE_INVOICE_PATTERNS)
+
+        # All patterns compiled once and run together over each text
+        self.scanner = ExtractionScanner(
+            self.amount_patterns,
+            self.date_patterns,
+            self.invoice_patterns,
+            self.standalone_invoice_patterns
+        )
+
+    def ocr_config_version(self) -> str:
+        """Identify the OCR configuration that produced a text, for caching"""
+        # Whether a PDF's text layer was trusted changes the text as much as the OCR profile
+        text_layer = f"text_layer={self.text_layer_min_chars}" if self.use_text_layer else "ocr_only"
+        return f"{OCR_CONFIG_VERSION}:{self.profile.name}:{text_layer}"
+
+    def time_left(self) -> Optional[float]:
+        """Seconds until the job deadline, used as the timeout of each subprocess"""
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise OCRTimeoutError("OCR job deadline passed")
+        return remaining
+
+    def _raise_if_past_deadline(self, error: Exception):
+        """Turn a failure caused by the job deadline into OCRTimeoutError instead of empty text"""
+        if isinstance(error, OCRTimeoutError):
+            raise error
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise OCRTimeoutError("OCR job deadline passed") from error
 
     def process_image(self, image_data: bytes) -> str:
         """Extract text from image using OCR"""
         try:
             logger.info("Processing image with OCR")
-            image = Image.open(io.BytesIO(image_data))
-            text = pytesseract.image_to_string(image)
+            image = load_image(image_data, self.profile)
+            text = pytesseract.image_to_string(image, timeout=self.time_left() or 0)
             logger.info(f"Successfully extracted {len(text)} characters from image")
             return text
         except Exception as e:
+            self._raise_if_past_deadline(e)
             logger.error(f"Error processing image: {str(e)}")
             return ""
 
-    def extract_text_from_pdf(self, pdf_data: bytes) -> str:
-        """Convert PDF to images and extract text using OCR"""
+    def ocr_pdf_page(self, pdf_data: bytes, page_number: int) -> Dict:
+        """Render and OCR a single PDF page"""
+        logger.info(f"Processing page {page_number} of PDF")
+        started = time.monotonic()
         try:
-            logger.info("Processing PDF document")
-            # Save PDF data to temporary file
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
-                temp_pdf.write(pdf_data)
-                temp_pdf_path = temp_pdf.name
-
-            # Convert PDF to images
-            images = pdf2image.convert_from_path(temp_pdf_path)
-            logger.info(f"Converted PDF to {len(images)} images")
-            
-            # Clean up temporary file
-            os.unlink(temp_pdf_path)
+            image = render_page(
+                pdf_data,
+                page_number,
+                dpi=self.profile.pdf_dpi,
+                grayscale=self.profile.grayscale,
+                timeout=self.time_left()
+            )
+            rendered = time.monotonic()
+            text = pytesseract.image_to_string(preprocess(image, self.profile), timeout=self.time_left() or 0)
+        except Exception as e:
+            # A render or Tesseract run cut short by the job deadline is a timeout, not a bad page
+            self._raise_if_past_deadline(e)
+            raise
+        return {
+            'page': page_number,
+            'text': text,
+            'source': 'ocr',
+            'render_seconds': rendered - started,
+            'ocr_seconds': time.monotonic() - rendered
+        }
 
-            # Extract text from each image
-            text = ""
-            for i, image in enumerate(images, 1):
-                logger.info(f"Processing page {i} of PDF")
-                text += pytesseract.image_to_string(image) + "\n"
+    def ocr_pdf_pages(self, pdf_data: bytes, page_numbers: List[int]) -> List[Dict]:
+        """Render and OCR several PDF pages on this processor's page threads"""
+        # Rendering and Tesseract both run as subprocesses, so threads scale across cores
+        workers = max(1, min(self.page_workers, len(page_numbers)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda page_number: self.ocr_pdf_page(pdf_data, page_number), page_numbers))
 
+    def _read_text_layer(self, pdf_data: bytes, page_count: int) -> List[str]:
+        """Read the embedded text of every page, or nothing if it can't be read"""
+        try:
+            return read_text_layer(pdf_data, page_count, timeout=self.time_left())
+        except (OSError, subprocess.SubprocessError) as e:
+            self._raise_if_past_deadline(e)
+            logger.warning(f"Could not read PDF text layer, falling back to OCR: {str(e)}")
+            return []
+
+    def is_usable_text(self, text: str) -> bool:
+        """Whether a page's text layer has enough real content to skip OCR"""
+        alphanumeric = sum(1 for ch in text if ch.isalnum())
+        if alphanumeric < self.text_layer_min_chars:
+            return False
+        # Fonts without a usable encoding come out as replacement or control characters
+        garbage = sum(1 for ch in text if ch == '\ufffd' or (ch < ' ' and ch not in '\n\r\t'))
+        return garbage <= alphanumeric * 0.1
+
+    @staticmethod
+    def text_source(pages: List[Dict]) -> str:
+        """Summarize which path produced the text of a document's pages"""
+        sources = {page['source'] for page in pages if page['source'] != 'skipped'}
+        if len(sources) == 1:
+            return sources.pop()
+        return 'mixed' if sources else 'none'
+
+    def extract_pages_from_pdf(self, pdf_data: bytes, stop_when: Optional[Callable[[str], bool]] = None,
+                               ocr_batch: Optional[Callable[[List[int]], Iterable[Dict]]] = None,
+                               batch_size: Optional[int] = None) -> List[Dict]:
+        """Extract PDF pages in page order, OCRing in parallel only pages without a usable text layer
+
+        Pages are rendered from the PDF bytes one at a time, so at most one
+        rendered page per page worker is held in memory. With stop_when, pages
+        are OCR'd batch_size at a time and the rest are returned as skipped
+        once it returns True for the text so far. ocr_batch OCRs a list of
+        page numbers somewhere else than this processor's page threads.
+        """
+        page_count = pdf_page_count(pdf_data, timeout=self.time_left())
+
+        pages: Dict[int, Dict] = {}
+        if self.use_text_layer:
+            started = time.monotonic()
+            text_layer = self._read_text_layer(pdf_data, page_count)
+            text_seconds = (time.monotonic() - started) / max(1, page_count)
+            for page_number, text in enumerate(text_layer, start=1):
+                if self.is_usable_text(text):
+                    pages[page_number] = {
+                        'page': page_number,
+                        'text': text,
+                        'source': 'text_layer',
+                        'render_seconds': 0.0,
+                        'ocr_seconds': 0.0,
+                        'text_seconds': text_seconds
+                    }
+
+        ocr_pages = [page_number for page_number in range(1, page_count + 1) if page_number not in pages]
+        logger.info(f"PDF has {page_count} pages, {len(pages)} with a text layer, OCRing {len(ocr_pages)}")
+
+        if ocr_pages:
+            if ocr_batch is None:
+                ocr_batch = lambda batch: self.ocr_pdf_pages(pdf_data, batch)
+                batch_size = batch_size or self.page_workers
+            # Without early exit every page goes out as a single batch
+            if not stop_when or not batch_size:
+                batch_size = len(ocr_pages)
+            while ocr_pages:
+                if stop_when and stop_when(self.join_pages([pages[number] for number in sorted(pages)])):
+                    break
+                batch, ocr_pages = ocr_pages[:batch_size], ocr_pages[batch_size:]
+                for page in ocr_batch(batch):
+                    pages[page['page']] = page
+
+            if ocr_pages:
+                logger.info(f"Required fields found, skipping OCR of {len(ocr_pages)} of {page_count} pages")
+            for page_number in ocr_pages:
+                pages[page_number] = {
+                    'page': page_number,
+                    'text': '',
+                    'source': 'skipped',
+                    'render_seconds': 0.0,
+                    'ocr_seconds': 0.0
+                }
+
+        return [pages[page_number] for page_number in range(1, page_count + 1)]
+
+    @staticmethod
+    def join_pages(pages: List[Dict]) -> str:
+        """Reassemble page texts in page order"""
+        return "".join(page['text'] + "\n" for page in pages)
+
+    @staticmethod
+    def page_offsets(pages: List[Dict]) -> List[int]:
+        """Where each page starts in the text join_pages builds from them"""
+        offsets, position = [], 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page['text']) + 1
+        return offsets
+
+    @staticmethod
+    def splice_pages(text: str, page_offsets: List[int], pages: List[Dict]) -> str:
+        """Replace pages of a text built by join_pages, found by the offsets they started at"""
+        bounds = page_offsets + [len(text)]
+        page_texts = [text[start:end - 1] for start, end in zip(bounds, bounds[1:])]
+        for page in pages:
+            page_texts[page['page'] - 1] = page['text']
+        return "".join(page_text + "\n" for page_text in page_texts)
+
+    def extract_text_from_pdf(self, pdf_data: bytes) -> str:
+        """Extract PDF text from its text layer, OCRing pages that have none"""
+        try:
+            logger.info("Processing PDF document")
+            pages = self.extract_pages_from_pdf(pdf_data)
+            text = self.join_pages(pages)
             logger.info(f"Successfully extracted {len(text)} characters from PDF")
             return text
         except Exception as e:
+            self._raise_if_past_deadline(e)
             logger.error(f"Error processing PDF: {str(e)}")
             return ""
 
+    # The single field extractors are kept for callers that need one field;
+    # extract_fields gets all three from one scanner.extract() call
+
     def extract_amounts(self, text: str) -> List[float]:
-        """Extract monetary amounts from text with improved precision"""
-        amounts = []
-        seen_amounts = set()  # Avoid duplicates
-        
-        # Look for amounts with dollar signs and context
-        for pattern in self.amount_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Get the amount part (might be in a group or the whole match)
-                if match.groups():
-                    amount_str = match.group(1)
-                else:
-                    amount_str = match.group(0)
-                
-                # Clean up the amount string
-                amount_str = re.sub(r'[^\d.,]', '', amount_str)
-                amount_str = amount_str.replace(',', '')
-                
-                try:
-                    amount = float(amount_str)
-                    # Filter out unrealistic amounts (too small or too large)
-                    if 0.01 <= amount <= 1000000 and amount not in seen_amounts:
-                        amounts.append(amount)
-                        seen_amounts.add(amount)
-                except ValueError:
-                    continue
-        
-        # Sort amounts by value (largest first, as main invoice amount is usually the largest)
-        amounts.sort(reverse=True)
+        """Extract monetary amounts from text, largest first"""
+        amounts = self.scanner.extract(text, fields=('amounts',))['amounts']
         logger.info(f"Found {len(amounts)} amounts in text")
         return amounts
 
     def extract_dates(self, text: str) -> List[datetime]:
-        """Extract dates from text with improved parsing"""
-        dates = []
-        seen_dates = set()  # Avoid duplicates
-        
-        for pattern in self.date_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                date_str = match.group(0)
-                
-                # Try different date formats
-                date_formats = [
-                    '%m/%d/%Y', '%m-%d-%Y', '%Y-%m-%d', 
-                    '%B %d, %Y', '%B %d %Y', '%b %d, %Y', '%b %d %Y'
-                ]
-                
-                for fmt in date_formats:
-                    try:
-                        date = datetime.strptime(date_str, fmt)
-                        if date not in seen_dates:
-                            dates.append(date)
-                            seen_dates.add(date)
-                        break
-                    except ValueError:
-                        continue
-        
+        """Extract dates from text"""
+        dates = self.scanner.extract(text, fields=('dates',))['dates']
         logger.info(f"Found {len(dates)} dates in text")
         return dates
 
     def extract_invoice_numbers(self, text: str) -> List[str]:
         """Extract complete invoice numbers from text"""
-        invoice_numbers = []
-        seen_numbers = set()  # Avoid duplicates
-        
-        for pattern in self.invoice_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                if len(match.groups()) > 0:
-                    invoice_num = match.group(1).strip()
-                    if invoice_num and invoice_num not in seen_numbers:
-                        invoice_numbers.append(invoice_num)
-                        seen_numbers.add(invoice_num)
-        
-        # Also look for standalone patterns that look like invoice numbers
-        standalone_patterns = [
-            r'\b([A-Z]{2,4}-\d{4}-\d{4,6})\b',  # INV-2024-123456
-            r'\b([A-Z]{3,}\d{6,})\b',           # ABC123456
-        ]
-        
-        for pattern in standalone_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                invoice_num = match.group(1).strip()
-                if invoice_num and invoice_num not in seen_numbers and len(invoice_num) >= 6:
-                    invoice_numbers.append(invoice_num)
-                    seen_numbers.add(invoice_num)
-        
+        invoice_numbers = self.scanner.extract(text, fields=('invoice_numbers',))['invoice_numbers']
         logger.info(f"Found {len(invoice_numbers)} invoice numbers in text")
         return invoice_numbers
 
@@ -222,15 +323,146 @@ class DocumentProcessor:
         logger.warning("No vendor name found")
         return None
 
-    def process_document(self, content: bytes, content_type: str, subject: str = "", sender: str = "") -> Dict:
-        """Process document and extract relevant information"""
+    def field_confidences(self, text: str, subject: str = "", sender: str = "") -> Dict[str, float]:
+        """Score how sure the extractors are of each field in the text so far
+
+        Labelled values score 1.0; values that could be something else, such
+        as an unlabelled amount or a vendor taken from the email, score lower.
+        """
+        amounts = invoice_numbers = standalone_numbers = dates = 0
+        for token in self.scanner.scan(text):
+            if token.kind == 'amount':
+                amounts += 1
+            elif token.kind == 'date':
+                dates += 1
+            elif token.kind == 'invoice' and token.value:
+                invoice_numbers += 1
+            elif token.kind == 'standalone_invoice' and len(token.value) >= MIN_STANDALONE_INVOICE_LENGTH:
+                standalone_numbers += 1
+
+        vendor_name = self.extract_vendor_name(text, subject, sender)
+        if not vendor_name:
+            vendor_confidence = 0.0
+        else:
+            vendor_confidence = 1.0 if vendor_name.casefold() in text.casefold() else 0.5
+
+        return {
+            'vendor_name': vendor_confidence,
+            'invoice_numbers': 1.0 if invoice_numbers else (0.6 if standalone_numbers else 0.0),
+            'dates': 1.0 if dates else 0.0,
+            'amounts': 1.0 if amounts and TOTAL_LABEL.search(text) else (0.6 if amounts else 0.0)
+        }
+
+    def has_required_fields(self, text: str, subject: str = "", sender: str = "") -> bool:
+        """Whether every early exit field reaches the configured confidence"""
+        confidences = self.field_confidences(text, subject, sender)
+        return all(confidences.get(field, 0.0) >= self.early_exit_confidence for field in self.early_exit_fields)
+
+    def extract_fields(self, text: str, content_type: str, subject: str = "", sender: str = "",
+                       page_timings: Optional[List[Dict]] = None, text_source: Optional[str] = None,
+                       pages_total: Optional[int] = None, pages_processed: Optional[int] = None,
+                       skipped_pages: Optional[List[int]] = None, page_offsets: Optional[List[int]] = None) -> Dict:
+        """Run the field extractors over already extracted text
+
+        skipped_pages and page_offsets say which pages early exit left out of
+        the text and where each page starts in it, for complete_pdf.
+        """
+        # One scanner run extracts amounts, dates and invoice numbers together
+        fields = self.scanner.extract(text)
+        amounts = fields['amounts']
+        dates = fields['dates']
+        invoice_numbers = fields['invoice_numbers']
+        vendor_name = self.extract_vendor_name(text, subject, sender)
+
+        result = {
+            'text': text,
+            'amounts': amounts,
+            'dates': dates,
+            'invoice_numbers': invoice_numbers,
+            'vendor_name': vendor_name,
+            'content_type': content_type,
+            'text_source': text_source,
+            'pages_total': pages_total,
+            'pages_processed': pages_total if pages_processed is None else pages_processed,
+            # False when early exit skipped pages; the full text is OCR'd on demand
+            'text_complete': pages_processed is None or pages_total is None or pages_processed >= pages_total,
+            'skipped_pages': skipped_pages or [],
+            'page_offsets': page_offsets if skipped_pages else None,
+            'page_timings': page_timings or []
+        }
+
+        logger.info(f"Document processing complete. Found: {len(amounts)} amounts, {len(dates)} dates, {len(invoice_numbers)} invoice numbers")
+        return result
+
+    def process_pdf(self, content: bytes, subject: str = "", sender: str = "", early_exit: Optional[bool] = None,
+                    ocr_batch: Optional[Callable[[List[int]], Iterable[Dict]]] = None,
+                    batch_size: Optional[int] = None) -> Dict:
+        """Extract a PDF's text and fields, raising instead of returning nothing on failure
+
+        early_exit overrides OCR_EARLY_EXIT; ocr_batch and batch_size are
+        passed on to extract_pages_from_pdf.
+        """
+        logger.info("Processing PDF document")
+        stop_when = None
+        if self.early_exit if early_exit is None else early_exit:
+            stop_when = lambda text_so_far: self.has_required_fields(text_so_far, subject, sender)
+        pages = self.extract_pages_from_pdf(content, stop_when, ocr_batch, batch_size)
+        text = self.join_pages(pages)
+        if not text:
+            logger.warning("No text extracted from document")
+            return {}
+        page_timings = [
+            {key: page.get(key, 0.0) for key in ('page', 'source', 'render_seconds', 'ocr_seconds', 'text_seconds')}
+            for page in pages
+        ]
+        skipped_pages = [page['page'] for page in pages if page['source'] == 'skipped']
+        return self.extract_fields(
+            text, 'application/pdf', subject, sender, page_timings, self.text_source(pages),
+            pages_total=len(pages),
+            pages_processed=len(pages) - len(skipped_pages),
+            skipped_pages=skipped_pages,
+            page_offsets=self.page_offsets(pages)
+        )
+
+    def complete_pdf(self, content: bytes, partial: Dict, subject: str = "", sender: str = "",
+                     ocr_batch: Optional[Callable[[List[int]], Iterable[Dict]]] = None) -> Dict:
+        """OCR only the pages early exit skipped and splice them into the text it left
+
+        partial is the early exit result, or the document stored from it,
+        with its text, skipped_pages, page_offsets, pages_total and text_source.
+        """
+        logger.info(f"OCRing {len(partial['skipped_pages'])} pages early exit skipped")
+        if ocr_batch is None:
+            ocr_batch = lambda batch: self.ocr_pdf_pages(content, batch)
+        pages = list(ocr_batch(partial['skipped_pages']))
+        text = self.splice_pages(partial['text'], partial['page_offsets'], pages)
+        # The pages OCR'd before early exit may have come from the text layer
+        text_source = 'ocr' if partial.get('text_source') in (None, 'none', 'ocr') else 'mixed'
+        pages_total = partial.get('pages_total') or len(partial['page_offsets'])
+        page_timings = [
+            {key: page.get(key, 0.0) for key in ('page', 'source', 'render_seconds', 'ocr_seconds', 'text_seconds')}
+            for page in pages
+        ]
+        return self.extract_fields(
+            text, 'application/pdf', subject, sender, page_timings, text_source, pages_total, pages_total
+        )
+
+    def process_document(self, content: bytes, content_type: str, subject: str = "", sender: str = "",
+                         early_exit: Optional[bool] = None) -> Dict:
+        """Process document and extract relevant information
+
+        early_exit overrides OCR_EARLY_EXIT for this document.
+        """
         try:
             logger.info(f"Processing document of type: {content_type}")
+            page_timings = []
             # Extract text based on content type
             if content_type.startswith('image/'):
                 text = self.process_image(content)
+                text_source = 'ocr'
+                pages_total = pages_processed = 1
             elif content_type == 'application/pdf':
-                text = self.extract_text_from_pdf(content)
+                return self.process_pdf(content, subject, sender, early_exit)
             else:
                 logger.warning(f"Unsupported content type: {content_type}")
                 return {}
@@ -239,24 +471,11 @@ class DocumentProcessor:
                 logger.warning("No text extracted from document")
                 return {}
 
-            # Extract information with improved algorithms
-            amounts = self.extract_amounts(text)
-            dates = self.extract_dates(text)
-            invoice_numbers = self.extract_invoice_numbers(text)
-            vendor_name = self.extract_vendor_name(text, subject, sender)
-
-            result = {
-                'text': text,
-                'amounts': amounts,
-                'dates': dates,
-                'invoice_numbers': invoice_numbers,
-                'vendor_name': vendor_name,
-                'content_type': content_type
-            }
-
-            logger.info(f"Document processing complete. Found: {len(amounts)} amounts, {len(dates)} dates, {len(invoice_numbers)} invoice numbers")
-            return result
+            return self.extract_fields(
+                text, content_type, subject, sender, page_timings, text_source, pages_total, pages_processed
+            )
 
         except Exception as e:
+            self._raise_if_past_deadline(e)
             logger.error(f"Error processing document: {str(e)}")
             return {} 
\ No newline at end of file
@@ -3,18 +3,26 @@ import email
 import os
 from email.header import decode_header
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Iterator, Optional, Tuple, Any
 import logging
 from dotenv import load_dotenv
 import re
+import select
+import threading
+import time
 from email.utils import parsedate_to_datetime
 from dataclasses import dataclass
+from imap_pool import IMAPConnectionPool
+from imap_bodystructure import BodyPart, decode_part, parse_fetch_response, walk_bodystructure
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.tiff')
+HEADER_FETCH = 'BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)]'
+
 @dataclass
 class Attachment:
     filename: str
@@ -28,26 +36,93 @@ class Email:
     sender: str
     date: Optional[datetime]
     attachments: List[Attachment]
+    # Attachment bytes reserved against an AttachmentBudget
+    size: int = 0
+
+class AttachmentBudget:
+    """Caps the attachment bytes of emails that are downloaded but not yet processed"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int):
+        """Block until size bytes fit; a single oversized email is let through alone"""
+        with self._condition:
+            while self._in_flight > 0 and self._in_flight + size > self.max_bytes:
+                self._condition.wait()
+            self._in_flight += size
+
+    def release(self, size: int):
+        """Return bytes once an email has been processed"""
+        with self._condition:
+            self._in_flight -= size
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Get in-flight and maximum bytes"""
+        with self._condition:
+            return {"in_flight_bytes": self._in_flight, "max_bytes": self.max_bytes}
 
 class EmailMonitor:
     def __init__(self):
         self.email_host = os.getenv('EMAIL_HOST', 'imap.gmail.com')
         self.email_user = os.getenv('EMAIL_USER')
         self.email_password = os.getenv('EMAIL_PASSWORD')
+        # Plain IMAP lets the monitor run against a local IMAP stand-in
+        self.email_use_ssl = os.getenv('EMAIL_USE_SSL', 'true').lower() != 'false'
+        self.email_port = int(os.getenv('EMAIL_PORT', '993' if self.email_use_ssl else '143'))
         
         if not all([self.email_host, self.email_user, self.email_password]):
             raise ValueError("Missing required email configuration in .env file")
 
-    def connect(self) -> imaplib.IMAP4_SSL:
+        self.processed_folder = 'Processed'
+        # Folders known to exist, so the move path doesn't LIST on every batch
+        self._known_folders = set()
+
+        # Authenticated sessions are reused across polls and the move path
+        self.pool = IMAPConnectionPool(
+            self.connect,
+            max_size=int(os.getenv('IMAP_POOL_SIZE', '2')),
+            keepalive_interval=float(os.getenv('IMAP_KEEPALIVE_INTERVAL', '300'))
+        )
+        self.pool.start_keepalive()
+
+        # Dedicated session held open for IMAP IDLE
+        self.idle_enabled = os.getenv('IMAP_IDLE', 'true').lower() != 'false'
+        self.idle_timeout = float(os.getenv('IMAP_IDLE_TIMEOUT', '1500'))
+        self._idle_mail: Optional[imaplib.IMAP4] = None
+        # Messages whose headers and BODYSTRUCTURE are fetched per command
+        self.fetch_batch_size = int(os.getenv('IMAP_FETCH_BATCH', '50'))
+        self.fetch_stats = {"bytes_fetched": 0, "parts_fetched": 0, "parts_skipped": 0}
+
+        # UIDNEXT of the folder at the last poll; mail at or above it arrived since
+        self._next_uid: Optional[int] = None
+
+    def connect(self) -> imaplib.IMAP4:
         """Establish connection to email server"""
         try:
-            mail = imaplib.IMAP4_SSL(self.email_host)
+            if self.email_use_ssl:
+                mail = imaplib.IMAP4_SSL(self.email_host, self.email_port)
+            else:
+                mail = imaplib.IMAP4(self.email_host, self.email_port)
             mail.login(self.email_user, self.email_password)
+            # Servers often advertise extensions such as MOVE only after login
+            _, capabilities = mail.capability()
+            mail.capabilities = tuple(capabilities[-1].decode().upper().split())
             return mail
         except Exception as e:
             logger.error(f"Failed to connect to email: {str(e)}")
             raise
 
+    def decode_filename(self, filename: str) -> str:
+        """Decode a MIME encoded-word filename"""
+        filename_tuple = decode_header(filename)[0]
+        if isinstance(filename_tuple[0], bytes):
+            filename = filename_tuple[0].decode(filename_tuple[1] or 'utf-8')
+        return filename
+
     def get_attachments(self, msg: email.message.Message) -> List[Attachment]:
         """Extract attachments from email message"""
         attachments = []
@@ -60,12 +135,10 @@ class EmailMonitor:
             filename = part.get_filename()
             if filename:
                 # Decode filename if needed
-                filename_tuple = decode_header(filename)[0]
-                if isinstance(filename_tuple[0], bytes):
-                    filename = filename_tuple[0].decode(filename_tuple[1] or 'utf-8')
+                filename = self.decode_filename(filename)
 
                 # Check if file type is supported
-                if filename.lower().endswith(('.pdf', '.jpg', '.jpeg', '.png', '.tiff')):
+                if filename.lower().endswith(SUPPORTED_EXTENSIONS):
                     attachments.append(Attachment(
                         filename=filename,
                         content=part.get_payload(decode=True),
@@ -74,6 +147,22 @@ class EmailMonitor:
         
         return attachments
 
+    def get_attachment_parts(self, structure: List[Any]) -> List[Tuple[BodyPart, str]]:
+        """Pick the BODYSTRUCTURE parts get_attachments would keep, with their filenames"""
+        parts = []
+        for part in walk_bodystructure(structure):
+            if part.disposition is None:
+                continue
+
+            filename = part.filename
+            if filename:
+                filename = self.decode_filename(filename)
+                if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    parts.append((part, filename))
+                    continue
+            self.fetch_stats["parts_skipped"] += 1
+        return parts
+
     def parse_date(self, date_str: str) -> Optional[datetime]:
         """Parse email date string into datetime object"""
         try:
@@ -102,89 +191,359 @@ class EmailMonitor:
             logger.warning(f"Could not parse date: {date_str}")
             return None
 
-    def process_email(self, email_id: bytes, mail: imaplib.IMAP4_SSL) -> Optional[Email]:
-        """Process a single email and extract relevant information"""
+    def build_email(self, email_id: str, msg: email.message.Message, attachments: List[Attachment]) -> Email:
+        """Build an Email from parsed headers and its attachments"""
+        # Extract basic email information
+        subject_tuple = decode_header(msg["subject"])[0]
+        subject = subject_tuple[0]
+        if isinstance(subject, bytes):
+            subject = subject.decode(subject_tuple[1] or 'utf-8')
+
+        sender = msg.get("from", "")
+        date_str = msg.get("date", "")
+        date = self.parse_date(date_str) if date_str else None
+
+        return Email(
+            id=email_id,
+            subject=subject,
+            sender=sender,
+            date=date,
+            attachments=attachments
+        )
+
+    def process_full_email(self, email_id: bytes, mail: imaplib.IMAP4) -> Optional[Email]:
+        """Process a single email by downloading the whole message"""
         try:
-            _, msg_data = mail.fetch(email_id, '(RFC822)')
+            _, msg_data = mail.uid('FETCH', email_id, '(RFC822)')
             email_body = msg_data[0][1]
+            self.fetch_stats["bytes_fetched"] += len(email_body)
             msg = email.message_from_bytes(email_body)
+            return self.build_email(email_id.decode(), msg, self.get_attachments(msg))
 
-            # Extract basic email information
-            subject_tuple = decode_header(msg["subject"])[0]
-            subject = subject_tuple[0]
-            if isinstance(subject, bytes):
-                subject = subject.decode(subject_tuple[1] or 'utf-8')
+        except Exception as e:
+            logger.error(f"Error processing email {email_id}: {str(e)}")
+            return None
 
-            sender = msg.get("from", "")
-            date_str = msg.get("date", "")
-            date = self.parse_date(date_str) if date_str else None
+    def message_size(self, mail: imaplib.IMAP4, email_id: bytes) -> int:
+        """Get the size of a message without downloading it, 0 if the server doesn't say"""
+        try:
+            _, data = mail.uid('FETCH', email_id, '(UID RFC822.SIZE)')
+            response = next((r for r in parse_fetch_response(data) if 'RFC822.SIZE' in r), {})
+            return int(response.get('RFC822.SIZE', 0))
+        except Exception as e:
+            logger.warning(f"Could not get the size of email {email_id}: {str(e)}")
+            return 0
+
+    def fetch_full_email(self, mail: imaplib.IMAP4, email_id: bytes, size: Optional[Any] = None,
+                         budget: Optional['AttachmentBudget'] = None) -> Tuple[Optional[Email], int]:
+        """Download a whole message once its size fits the budget
 
-            # Get attachments
-            attachments = self.get_attachments(msg)
+        Returns the email and the bytes it holds in the budget, which is
+        only its attachments once the raw message has been parsed.
+        """
+        reserved = 0
+        if budget:
+            reserved = int(size) if size is not None else self.message_size(mail, email_id)
+            budget.acquire(reserved)
+        processed_email = self.process_full_email(email_id, mail)
+        attachment_bytes = 0
+        if processed_email is not None:
+            attachment_bytes = sum(len(attachment.content or b'') for attachment in processed_email.attachments)
+        if budget:
+            budget.release(reserved - attachment_bytes)
+        return processed_email, attachment_bytes
 
-            return Email(
-                id=email_id.decode(),
-                subject=subject,
-                sender=sender,
-                date=date,
-                attachments=attachments
-            )
+    def fetch_attachments(self, mail: imaplib.IMAP4, uid: str,
+                          parts: List[Tuple[BodyPart, str]]) -> List[Attachment]:
+        """Download only the given MIME parts of a message"""
+        if not parts:
+            return []
+
+        sections = ' '.join(f"BODY.PEEK[{part.section}]" for part, _ in parts)
+        _, data = mail.uid('FETCH', uid, f"({sections})")
+        response = next((r for r in parse_fetch_response(data) if str(r.get('UID', uid)) == uid), {})
 
+        attachments = []
+        for part, filename in parts:
+            payload = response.get(f"BODY[{part.section}]")
+            if payload is None:
+                raise ValueError(f"Server returned no data for part {part.section}")
+            payload = payload if isinstance(payload, bytes) else payload.encode('utf-8')
+            self.fetch_stats["bytes_fetched"] += len(payload)
+            self.fetch_stats["parts_fetched"] += 1
+            attachments.append(Attachment(
+                filename=filename,
+                content=decode_part(payload, part.encoding),
+                content_type=part.content_type
+            ))
+        return attachments
+
+    def iter_fetched_emails(self, mail: imaplib.IMAP4, email_ids: List[bytes],
+                            budget: Optional['AttachmentBudget'] = None) -> Iterator[Email]:
+        """Fetch headers and structure first, then only the attachment parts worth processing"""
+        if not email_ids:
+            return
+
+        uid_set = self.compress_uid_set([email_id.decode() for email_id in email_ids])
+        _, data = mail.uid('FETCH', uid_set, f"(UID RFC822.SIZE BODYSTRUCTURE {HEADER_FETCH})")
+        try:
+            responses = {str(r['UID']): r for r in parse_fetch_response(data) if 'UID' in r}
         except Exception as e:
-            logger.error(f"Error processing email {email_id}: {str(e)}")
-            return None
+            logger.warning(f"Could not parse BODYSTRUCTURE response, downloading full messages: {str(e)}")
+            responses = {}
 
-    def check_new_emails(self, folder: str = 'INBOX') -> List[Email]:
-        """Check for new unread emails in specified folder"""
-        mail = self.connect()
+        for email_id in email_ids:
+            uid = email_id.decode()
+            response = responses.pop(uid, None)
+            reserved = 0
+            try:
+                # Servers differ in how they echo the header section name
+                headers = next((value for key, value in (response or {}).items() if key.startswith('BODY[HEADER')), None)
+                if response is None or 'BODYSTRUCTURE' not in response or headers is None:
+                    raise ValueError("Missing BODYSTRUCTURE response")
+                parts = self.get_attachment_parts(response['BODYSTRUCTURE'])
+                msg = email.message_from_bytes(bytes(headers))
+
+                # Wait for room in the budget before downloading anything
+                reserved = sum(part.size for part, _ in parts)
+                if budget:
+                    budget.acquire(reserved)
+                processed_email = self.build_email(uid, msg, self.fetch_attachments(mail, uid, parts))
+            except Exception as e:
+                if budget:
+                    budget.release(reserved)
+                logger.warning(f"Structure fetch failed for email {uid}, downloading full message: {str(e)}")
+                processed_email, reserved = self.fetch_full_email(
+                    mail, email_id, (response or {}).get('RFC822.SIZE'), budget
+                )
+                if processed_email is None:
+                    continue
+
+            processed_email.size = reserved
+            yield processed_email
+
+    def fetch_emails(self, mail: imaplib.IMAP4, email_ids: List[bytes]) -> List[Email]:
+        """Fetch a batch of emails"""
+        return list(self.iter_fetched_emails(mail, email_ids))
+
+    def process_email(self, email_id: bytes, mail: imaplib.IMAP4) -> Optional[Email]:
+        """Process a single email and extract relevant information"""
+        emails = self.fetch_emails(mail, [email_id])
+        return emails[0] if emails else None
+
+    def iter_new_emails(self, folder: str = 'INBOX',
+                        budget: Optional['AttachmentBudget'] = None) -> Iterator[Email]:
+        """Yield new unread emails one at a time as they are downloaded
+
+        With a budget, each email reserves its attachment bytes before download and the
+        consumer must release ``email.size`` once it is done with the email.
+        """
         try:
-            mail.select(folder)
-            _, messages = mail.search(None, 'UNSEEN')
-            
-            email_data = []
-            for email_id in messages[0].split():
-                processed_email = self.process_email(email_id, mail)
-                if processed_email:
-                    email_data.append(processed_email)
+            with self.pool.session() as mail:
+                mail.select(folder)
+                # Read mail can sit above the newest unread UID, so the high-water
+                # mark comes from the whole folder rather than the UNSEEN search
+                self._next_uid = self.uid_next(mail)
+                _, messages = mail.uid('SEARCH', None, 'UNSEEN')
 
-            return email_data
+                email_ids = messages[0].split()
+                for start in range(0, len(email_ids), self.fetch_batch_size):
+                    yield from self.iter_fetched_emails(mail, email_ids[start:start + self.fetch_batch_size], budget)
 
         except Exception as e:
             logger.error(f"Error checking new emails: {str(e)}")
-            return []
 
-        finally:
-            try:
-                mail.close()
-                mail.logout()
-            except:
-                pass
+    def iter_new_email_batches(self, batch_size: int, folder: str = 'INBOX',
+                               budget: Optional['AttachmentBudget'] = None) -> Iterator[List[Email]]:
+        """Yield new unread emails in small batches"""
+        batch = []
+        for new_email in self.iter_new_emails(folder, budget):
+            batch.append(new_email)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
-    def mark_as_processed(self, email_id: str, folder: str = 'INBOX') -> bool:
-        """Mark an email as processed by moving it to a processed folder"""
-        mail = self.connect()
-        try:
+    def check_new_emails(self, folder: str = 'INBOX') -> List[Email]:
+        """Check for new unread emails in specified folder"""
+        return list(self.iter_new_emails(folder))
+
+    @staticmethod
+    def compress_uid_set(uids: List[str]) -> str:
+        """Collapse UIDs into an IMAP sequence set such as 1:4,7,9:10"""
+        numbers = sorted({int(uid) for uid in uids})
+        ranges = []
+        start = prev = numbers[0]
+        for number in numbers[1:]:
+            if number != prev + 1:
+                ranges.append(f"{start}:{prev}" if start != prev else str(start))
+                start = number
+            prev = number
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        return ",".join(ranges)
+
+    def ensure_folder(self, mail: imaplib.IMAP4, folder: str):
+        """Create a folder unless it is already known to exist"""
+        if folder in self._known_folders:
+            return
+        _, folders = mail.list('""', folder)
+        if not folders or folders[0] is None:
+            mail.create(folder)
+        self._known_folders.add(folder)
+
+    def mark_as_processed_batch(self, email_ids: List[str], folder: str = 'INBOX') -> bool:
+        """Move a batch of emails to the processed folder in as few commands as possible"""
+        if not email_ids:
+            return True
+        uid_set = self.compress_uid_set(email_ids)
+
+        def move(mail: imaplib.IMAP4) -> bool:
             mail.select(folder)
-            
-            # Create processed folder if it doesn't exist
-            processed_folder = 'Processed'
-            if processed_folder not in [f.decode().split('"/')[-1].strip('"') for f in mail.list()[1]]:
-                mail.create(processed_folder)
-            
-            # Move email to processed folder
-            mail.copy(email_id.encode(), processed_folder)
-            mail.store(email_id.encode(), '+FLAGS', '\\Deleted')
-            mail.expunge()
-            
+            self.ensure_folder(mail, self.processed_folder)
+
+            if 'MOVE' in mail.capabilities:
+                typ, data = mail.uid('MOVE', uid_set, self.processed_folder)
+                if typ == 'OK':
+                    return True
+                logger.warning(f"UID MOVE failed ({data}), falling back to COPY and EXPUNGE")
+
+            typ, data = mail.uid('COPY', uid_set, self.processed_folder)
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"UID COPY failed: {data}")
+            mail.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)')
+            if 'UIDPLUS' in mail.capabilities:
+                mail.uid('EXPUNGE', uid_set)
+            else:
+                mail.expunge()
             return True
 
+        try:
+            moved = self.pool.run(move)
+            logger.info(f"Moved {len(email_ids)} emails to {self.processed_folder}")
+            return moved
         except Exception as e:
-            logger.error(f"Error marking email {email_id} as processed: {str(e)}")
+            logger.error(f"Error marking {len(email_ids)} emails as processed: {str(e)}")
             return False
 
-        finally:
-            try:
-                mail.close()
-                mail.logout()
-            except:
-                pass 
\ No newline at end of file
+    def mark_as_processed(self, email_id: str, folder: str = 'INBOX') -> bool:
+        """Mark an email as processed by moving it to a processed folder"""
+        return self.mark_as_processed_batch([email_id], folder)
+
+    @staticmethod
+    def uid_next(mail: imaplib.IMAP4) -> int:
+        """UID the next message in the selected folder will get
+
+        Taken from the UIDNEXT of the SELECT response, or one past the
+        highest UID in the folder on servers that don't send it.
+        """
+        _, data = mail.response('UIDNEXT')
+        if data and data[-1]:
+            return int(data[-1])
+        _, data = mail.uid('SEARCH', None, 'ALL')
+        uids = data[0].split() if data and data[0] else []
+        return max((int(uid) for uid in uids), default=0) + 1
+
+    def supports_idle(self) -> bool:
+        """Check whether push mode is enabled and the server supports IDLE"""
+        if not self.idle_enabled:
+            return False
+        if self._idle_mail is None:
+            self._idle_mail = self.connect()
+        return 'IDLE' in self._idle_mail.capabilities
+
+    def wait_for_new_mail(self, folder: str = 'INBOX', timeout: Optional[float] = None) -> bool:
+        """Block in IMAP IDLE until new messages arrive or the timeout expires"""
+        if not self.supports_idle():
+            raise imaplib.IMAP4.error("Server does not support IDLE")
+        mail = self._idle_mail
+        try:
+            mail.select(folder, readonly=True)
+
+            # Catch mail that arrived between the last poll and entering IDLE
+            if self._next_uid is not None and self.uid_next(mail) > self._next_uid:
+                return True
+
+            return self._idle(mail, timeout or self.idle_timeout)
+        except Exception:
+            self.stop_idle()
+            raise
+
+    def _idle(self, mail: imaplib.IMAP4, timeout: float) -> bool:
+        """Hold one IDLE command, returning True if the server reported EXISTS"""
+        # IDLE isn't supported by imaplib, so the exchange is read straight off the socket
+        sock = mail.socket()
+        tag = mail._new_tag()
+        buffer = b''
+
+        def read_line(wait: float) -> Optional[bytes]:
+            nonlocal buffer
+            while b'\r\n' not in buffer:
+                # TLS may already hold decrypted bytes that select() can't see
+                pending = sock.pending() if hasattr(sock, 'pending') else 0
+                if not pending and not select.select([sock], [], [], max(0.0, wait))[0]:
+                    return None
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise imaplib.IMAP4.abort("Connection closed during IDLE")
+                buffer += chunk
+            line, buffer = buffer.split(b'\r\n', 1)
+            return line
+
+        sock.sendall(tag + b' IDLE\r\n')
+        while True:
+            line = read_line(30)
+            if line is None or line.startswith(tag):
+                raise imaplib.IMAP4.error(f"IDLE not accepted: {line!r}")
+            if line.startswith(b'+'):
+                break
+
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        while not new_mail:
+            line = read_line(deadline - time.monotonic())
+            if line is None:
+                break
+            if re.match(rb'\* \d+ EXISTS', line):
+                new_mail = True
+
+        sock.sendall(b'DONE\r\n')
+        while True:
+            line = read_line(30)
+            if line is None:
+                raise imaplib.IMAP4.abort("Timed out waiting for IDLE to finish")
+            if line.startswith(tag):
+                return new_mail
+
+    def stop_idle(self):
+        """Drop the IDLE session, waking any thread blocked on it"""
+        mail, self._idle_mail = self._idle_mail, None
+        if mail is None:
+            return
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+
+    def close(self):
+        """Log out of all pooled sessions"""
+        self.stop_idle()
+        self.pool.close()
+
+
+class AdaptivePollInterval:
+    """Poll interval that backs off while the inbox is quiet"""
+
+    def __init__(self, minimum: Optional[float] = None, maximum: Optional[float] = None, factor: float = 2.0):
+        self.minimum = minimum or float(os.getenv('POLL_INTERVAL_MIN', '15'))
+        self.maximum = maximum or float(os.getenv('POLL_INTERVAL_MAX', '300'))
+        self.factor = factor
+        self.current = self.minimum
+
+    def next(self, found_mail: bool) -> float:
+        """Get the wait before the next poll, given whether the last poll found mail"""
+        if found_mail:
+            self.current = self.minimum
+        else:
+            self.current = min(self.maximum, self.current * self.factor)
+        return self.current
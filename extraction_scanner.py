@@ -0,0 +1,200 @@
+import heapq
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Improved patterns for better accuracy
+AMOUNT_PATTERNS = [
+    r'\$\s*\d{1,3}(?:,\d{3})*(?:\.\d{2})',  # $1,234.56 format
+    r'\$\s*\d+\.\d{2}',  # $123.45 format
+    r'(?:Total|Amount|Due|Balance)[\s:]*\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',  # Context-aware amounts
+    r'(?:USD|CAD)?\s*\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2}))',  # Currency prefixed amounts
+]
+
+DATE_PATTERNS = [
+    r'\d{1,2}/\d{1,2}/\d{4}',  # MM/DD/YYYY or M/D/YYYY
+    r'\d{1,2}-\d{1,2}-\d{4}',  # MM-DD-YYYY or M-D-YYYY
+    r'\d{4}-\d{1,2}-\d{1,2}',  # YYYY-MM-DD or YYYY-M-D
+    r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',  # Full month names
+    r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}'  # Abbreviated month names
+]
+
+INVOICE_PATTERNS = [
+    r'(?i)invoice\s*#?\s*:?\s*([A-Z]{2,4}-\d{4}-\d{4,6})',  # INV-2024-123456 format
+    r'(?i)inv\s*#?\s*:?\s*([A-Z]{2,4}-\d{4}-\d{4,6})',     # INV-2024-123456 format
+    r'(?i)invoice\s*(?:number|no|#)\s*:?\s*([A-Z0-9-]{6,})', # Invoice Number: ABC-123
+    r'(?i)bill\s*#?\s*:?\s*([A-Z0-9-]{6,})',               # Bill # ABC-123
+    r'(?i)reference\s*#?\s*:?\s*([A-Z0-9-]{6,})',          # Reference # ABC-123
+]
+
+# Standalone patterns that look like invoice numbers without a label
+STANDALONE_INVOICE_PATTERNS = [
+    r'\b([A-Z]{2,4}-\d{4}-\d{4,6})\b',  # INV-2024-123456
+    r'\b([A-Z]{3,}\d{6,})\b',           # ABC123456
+]
+
+# Characters the matches of a pattern can start with, under the flags the
+# scanner compiles it with. A lookahead on them is checked much faster than
+# the pattern's own alternation at every position, and matches stay the
+# same. Patterns that start with \d or a literal are already fast and got
+# slower with one, so they are left out.
+FIRST_CHARACTERS = {
+    AMOUNT_PATTERNS[2]: 'TADB',
+    DATE_PATTERNS[3]: 'ADFJMNOS',
+    DATE_PATTERNS[4]: 'ADFJMNOS',
+    STANDALONE_INVOICE_PATTERNS[0]: 'A-Z',
+    STANDALONE_INVOICE_PATTERNS[1]: 'A-Z',
+}
+
+# Formats tried in order on every matched date string
+DATE_FORMATS = [
+    '%m/%d/%Y', '%m-%d-%Y', '%Y-%m-%d',
+    '%B %d, %Y', '%B %d %Y', '%b %d, %Y', '%b %d %Y'
+]
+
+# Amounts outside this range are treated as noise
+MIN_AMOUNT = 0.01
+MAX_AMOUNT = 1000000
+
+# Standalone invoice number matches shorter than this are ignored
+MIN_STANDALONE_INVOICE_LENGTH = 6
+
+# Field of extract() filled by each token kind
+FIELD_OF_KIND = {
+    'amount': 'amounts',
+    'date': 'dates',
+    'invoice': 'invoice_numbers',
+    'standalone_invoice': 'invoice_numbers'
+}
+FIELDS = ('amounts', 'dates', 'invoice_numbers')
+
+@dataclass
+class Token:
+    kind: str  # amount, date, invoice or standalone_invoice
+    value: Any
+    start: int
+    end: int
+    pattern_index: int
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str: str) -> Optional[datetime]:
+    """Parse a matched date string with the first format that fits"""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+def parse_amount(amount_str: str) -> Optional[float]:
+    """Keep only digits and the decimal point of a matched amount"""
+    cleaned = ''.join(ch for ch in amount_str if ch.isdecimal() or ch == '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+def with_first_characters(pattern: str) -> str:
+    """Prefix a pattern with a lookahead on the characters its matches start with, if known"""
+    first = FIRST_CHARACTERS.get(pattern)
+    if first is None:
+        return pattern
+    # Inline global flags have to stay at the start
+    flags = re.match(r'\(\?[aiLmsux]+\)', pattern)
+    prefix = flags.group(0) if flags else ''
+    return f"{prefix}(?=[{first}]){pattern[len(prefix):]}"
+
+class ExtractionScanner:
+    """Compiled extraction engine for amounts, dates and invoice numbers
+
+    Every pattern is compiled once and run with its own finditer, so each
+    keeps its literal prefix skipping in the regex engine; one merged
+    lookahead alternation measured slower because it has to try every
+    pattern at every position. Patterns in FIRST_CHARACTERS get a leading
+    lookahead, which takes most of the time out of the month name and
+    "Total" patterns. Matches come out as typed tokens with their
+    positions, and extract() gives the same results as running each pattern
+    list separately.
+    """
+
+    def __init__(self, amount_patterns: Sequence[str], date_patterns: Sequence[str],
+                 invoice_patterns: Sequence[str], standalone_invoice_patterns: Sequence[str]):
+        specs = (
+            [('amount', re.compile(with_first_characters(pattern), re.IGNORECASE)) for pattern in amount_patterns]
+            + [('date', re.compile(with_first_characters(pattern), re.IGNORECASE)) for pattern in date_patterns]
+            + [('invoice', re.compile(with_first_characters(pattern))) for pattern in invoice_patterns]
+            + [
+                ('standalone_invoice', re.compile(with_first_characters(pattern)))
+                for pattern in standalone_invoice_patterns
+            ]
+        )
+        self._specs: List[Tuple[str, re.Pattern]] = specs
+
+    @staticmethod
+    def _value(kind: str, match: re.Match, has_groups: bool) -> Any:
+        if kind == 'amount':
+            return parse_amount(match.group(1) if has_groups else match.group(0))
+        if kind == 'date':
+            return parse_date(match.group(0))
+        return match.group(1).strip() if has_groups else None
+
+    def _tokens(self, index: int, text: str) -> Iterator[Token]:
+        kind, pattern = self._specs[index]
+        has_groups = pattern.groups > 0
+        for match in pattern.finditer(text):
+            value = self._value(kind, match, has_groups)
+            if value is not None:
+                yield Token(kind, value, match.start(), match.end(), index)
+
+    def scan(self, text: str) -> Iterator[Token]:
+        """Yield a token for every pattern match, in text order"""
+        return heapq.merge(
+            *(self._tokens(index, text) for index in range(len(self._specs))),
+            key=lambda token: (token.start, token.pattern_index)
+        )
+
+    def extract(self, text: str, fields: Collection[str] = FIELDS) -> Dict[str, List]:
+        """Extract amounts, dates and invoice numbers from text
+
+        Only the patterns of the requested fields run, and only those fields
+        are returned.
+        """
+        amounts = set()
+        dates = []
+        seen_dates = set()
+        invoice_numbers = []
+        seen_numbers = set()
+
+        # Dates and invoice numbers keep the order of running each pattern in
+        # turn. The loops are split by kind since this runs over every text.
+        for kind, pattern in self._specs:
+            if FIELD_OF_KIND[kind] not in fields:
+                continue
+            has_groups = pattern.groups > 0
+            if kind == 'amount':
+                for match in pattern.finditer(text):
+                    amount = parse_amount(match.group(1) if has_groups else match.group(0))
+                    if amount is not None and MIN_AMOUNT <= amount <= MAX_AMOUNT:
+                        amounts.add(amount)
+            elif kind == 'date':
+                for match in pattern.finditer(text):
+                    date = parse_date(match.group(0))
+                    if date is not None and date not in seen_dates:
+                        dates.append(date)
+                        seen_dates.add(date)
+            elif has_groups:
+                min_length = MIN_STANDALONE_INVOICE_LENGTH if kind == 'standalone_invoice' else 0
+                for match in pattern.finditer(text):
+                    number = match.group(1).strip()
+                    if number and number not in seen_numbers and len(number) >= min_length:
+                        invoice_numbers.append(number)
+                        seen_numbers.add(number)
+
+        extracted = {
+            'amounts': sorted(amounts, reverse=True),
+            'dates': dates,
+            'invoice_numbers': invoice_numbers
+        }
+        return {field: values for field, values in extracted.items() if field in fields}
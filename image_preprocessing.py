@@ -0,0 +1,106 @@
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Photos carry no physical size, so they are scaled as if the page's long edge
+# were this many inches (US letter / A4)
+PAGE_LONG_EDGE_INCHES = 11.0
+
+# Resolution PDF pages were rendered at before profiles existed
+DEFAULT_PDF_DPI = 200
+
+@dataclass(frozen=True)
+class PreprocessingProfile:
+    name: str
+    grayscale: bool = True
+    # Resolution images are downscaled to; None keeps the original size
+    target_dpi: Optional[int] = None
+    # Threshold to black and white before OCR
+    binarize: bool = False
+    # Let the JPEG decoder skip detail that downscaling would discard anyway
+    draft: bool = False
+
+    @property
+    def max_long_edge(self) -> Optional[int]:
+        return round(self.target_dpi * PAGE_LONG_EDGE_INCHES) if self.target_dpi else None
+
+    @property
+    def pdf_dpi(self) -> int:
+        """Resolution PDF pages are rendered at, never above the default"""
+        return min(self.target_dpi, DEFAULT_PDF_DPI) if self.target_dpi else DEFAULT_PDF_DPI
+
+PROFILES: Dict[str, PreprocessingProfile] = {
+    "accurate": PreprocessingProfile("accurate"),
+    "balanced": PreprocessingProfile("balanced", target_dpi=300, draft=True),
+    "fast": PreprocessingProfile("fast", target_dpi=150, binarize=True, draft=True),
+}
+
+def get_profile(name: Optional[str] = None) -> PreprocessingProfile:
+    """Look up a profile by name, defaulting to OCR_PROFILE"""
+    name = (name or os.getenv('OCR_PROFILE', 'accurate')).lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown OCR profile: {name} (expected one of {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+def otsu_threshold(image: Image.Image) -> int:
+    """Threshold that best separates the two peaks of a grayscale histogram"""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = 0
+    weighted_background = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = level
+    return best_threshold
+
+def _scaled_size(size, max_long_edge: Optional[int]):
+    width, height = size
+    long_edge = max(width, height)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return size
+    scale = max_long_edge / long_edge
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def preprocess(image: Image.Image, profile: PreprocessingProfile) -> Image.Image:
+    """Apply a profile's grayscale, downscale and binarize steps to a decoded image"""
+    if profile.grayscale and image.mode != 'L':
+        image = image.convert('L')
+    size = _scaled_size(image.size, profile.max_long_edge)
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+    if profile.binarize:
+        gray = image if image.mode == 'L' else image.convert('L')
+        threshold = otsu_threshold(gray)
+        image = gray.point([0 if level <= threshold else 255 for level in range(256)])
+    return image
+
+def load_image(image_data: bytes, profile: PreprocessingProfile) -> Image.Image:
+    """Decode image bytes for OCR, using JPEG draft mode when the profile allows"""
+    image = Image.open(io.BytesIO(image_data))
+    if profile.draft and image.format == 'JPEG':
+        # Decodes at 1/2, 1/4 or 1/8 scale while staying above the requested size
+        image.draft('L' if profile.grayscale else 'RGB', _scaled_size(image.size, profile.max_long_edge))
+    # Phone photos are often stored sideways with an EXIF orientation
+    image = ImageOps.exif_transpose(image)
+    return preprocess(image, profile)
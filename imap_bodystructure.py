@@ -0,0 +1,176 @@
+from email.message import Message
+from email.utils import quote
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# Literal payloads are wrapped so the parser can tell them apart from atoms
+class Literal(bytes):
+    pass
+
+@dataclass
+class BodyPart:
+    section: str
+    content_type: str
+    params: Dict[str, str] = field(default_factory=dict)
+    encoding: str = '7bit'
+    size: int = 0
+    disposition: Optional[str] = None
+    disposition_params: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def filename(self) -> Optional[str]:
+        """Filename resolved exactly as email.message.Message.get_filename() would"""
+        msg = Message()
+        msg['Content-Type'] = self.content_type + _format_params(self.params)
+        if self.disposition:
+            msg['Content-Disposition'] = self.disposition + _format_params(self.disposition_params)
+        return msg.get_filename()
+
+def _format_params(params: Dict[str, str]) -> str:
+    return ''.join(f'; {name}="{quote(value)}"' for name, value in params.items())
+
+def _segments(fetch_data: List[Union[bytes, Tuple[bytes, bytes]]]) -> Iterator[bytes]:
+    for item in fetch_data:
+        if isinstance(item, tuple):
+            yield item[0]
+            yield Literal(item[1])
+        elif item is not None:
+            yield item
+
+def _tokenize(fetch_data: List[Union[bytes, Tuple[bytes, bytes]]]) -> Iterator[Any]:
+    for segment in _segments(fetch_data):
+        if isinstance(segment, Literal):
+            yield segment
+            continue
+
+        i = 0
+        length = len(segment)
+        while i < length:
+            c = segment[i:i + 1]
+            if c in (b' ', b'\r', b'\n'):
+                i += 1
+            elif c in (b'(', b')'):
+                yield c
+                i += 1
+            elif c == b'"':
+                i += 1
+                value = bytearray()
+                while i < length and segment[i:i + 1] != b'"':
+                    if segment[i:i + 1] == b'\\':
+                        i += 1
+                    value += segment[i:i + 1]
+                    i += 1
+                i += 1
+                yield value.decode('utf-8', 'replace')
+            elif c == b'{' or segment[i:i + 2] == b'~{':
+                # Literal size marker; the literal itself is the next segment
+                i = segment.index(b'}', i) + 1
+            else:
+                start = i
+                depth = 0
+                while i < length:
+                    c = segment[i:i + 1]
+                    if c == b'[':
+                        depth += 1
+                    elif c == b']':
+                        depth -= 1
+                    elif depth == 0 and c in (b' ', b'(', b')', b'\r', b'\n'):
+                        break
+                    i += 1
+                atom = segment[start:i].decode('utf-8', 'replace')
+                yield None if atom.upper() == 'NIL' else atom
+
+def _parse_value(token: Any, tokens: Iterator[Any]) -> Any:
+    if token == b'(':
+        values = []
+        while True:
+            token = next(tokens)
+            if token == b')':
+                return values
+            values.append(_parse_value(token, tokens))
+    return token
+
+def parse_fetch_response(fetch_data: List[Union[bytes, Tuple[bytes, bytes]]]) -> List[Dict[str, Any]]:
+    """Parse imaplib FETCH data into one dict of data items per message"""
+    messages = []
+    tokens = _tokenize(fetch_data)
+    for _ in tokens:  # message sequence number
+        items = _parse_value(next(tokens), tokens)
+        if not isinstance(items, list):
+            continue
+        messages.append({
+            str(items[i]).upper(): items[i + 1]
+            for i in range(0, len(items) - 1, 2)
+        })
+    return messages
+
+def _text(value: Any) -> str:
+    """String value of an atom, quoted string or literal"""
+    if isinstance(value, bytes):
+        # Servers send names with quotes or 8-bit characters as literals
+        return value.decode('utf-8', 'replace')
+    return '' if value is None else str(value)
+
+def _params(values: Any) -> Dict[str, str]:
+    if not isinstance(values, list):
+        return {}
+    return {
+        _text(values[i]).lower(): _text(values[i + 1]) if not isinstance(values[i + 1], list) else ''
+        for i in range(0, len(values) - 1, 2)
+    }
+
+def _disposition(structure: List[Any], index: int) -> Tuple[Optional[str], Dict[str, str]]:
+    if len(structure) > index and isinstance(structure[index], list) and structure[index]:
+        disposition = structure[index]
+        return _text(disposition[0]).lower(), _params(disposition[1] if len(disposition) > 1 else None)
+    return None, {}
+
+def walk_bodystructure(structure: List[Any], section: str = '') -> Iterator[BodyPart]:
+    """Yield every leaf part of a BODYSTRUCTURE with its section number"""
+    if structure and isinstance(structure[0], list):
+        # Multipart: child bodies first, then the subtype and extension data
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            yield from walk_bodystructure(child, f"{section}.{number}" if section else str(number))
+        return
+
+    maintype = _text(structure[0]).lower()
+    subtype = _text(structure[1]).lower()
+    part_section = section or '1'
+
+    # Extension data follows the type specific fields
+    if maintype == 'text':
+        disposition_index = 9
+    elif maintype == 'message' and subtype == 'rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition, disposition_params = _disposition(structure, disposition_index)
+
+    yield BodyPart(
+        section=part_section,
+        content_type=f"{maintype}/{subtype}",
+        params=_params(structure[2]),
+        encoding=(_text(structure[5]) or '7bit').lower(),
+        size=int(structure[6]) if str(structure[6]).isdigit() else 0,
+        disposition=disposition,
+        disposition_params=disposition_params
+    )
+
+    # Attached messages are walked into, matching email.message.Message.walk()
+    if maintype == 'message' and subtype == 'rfc822' and len(structure) > 8 and isinstance(structure[8], list):
+        inner = structure[8]
+        if inner and isinstance(inner[0], list):
+            yield from walk_bodystructure(inner, part_section)
+        else:
+            yield from walk_bodystructure(inner, f"{part_section}.1")
+
+def decode_part(payload: bytes, encoding: str) -> bytes:
+    """Decode a fetched part body using its Content-Transfer-Encoding"""
+    msg = Message()
+    msg['Content-Transfer-Encoding'] = encoding
+    msg.set_payload(payload.decode('ascii', 'surrogateescape'))
+    return msg.get_payload(decode=True)
@@ -0,0 +1,169 @@
+import imaplib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Errors that mean the session itself is unusable rather than a failed command
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+class IMAPConnectionPool:
+    """Keeps authenticated IMAP sessions alive for reuse"""
+
+    def __init__(self, connect: Callable[[], imaplib.IMAP4], max_size: int = 2,
+                 keepalive_interval: float = 300.0, validate_after: float = 30.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.keepalive_interval = keepalive_interval
+        self.validate_after = validate_after
+        self._idle: List[Tuple[imaplib.IMAP4, float]] = []
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._handshakes = 0
+        self._reuses = 0
+        self._reconnects = 0
+        self._keepalives = 0
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+    def _checkout(self) -> imaplib.IMAP4:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                mail, last_used = self._idle.pop()
+                self._in_use += 1
+
+            # Sessions that sat idle a while are checked before being handed out
+            if time.monotonic() - last_used < self.validate_after or self._noop(mail):
+                with self._lock:
+                    self._reuses += 1
+                return mail
+
+            with self._lock:
+                self._in_use -= 1
+                self._reconnects += 1
+            logger.info("Dropped stale IMAP session, reconnecting")
+            self._logout(mail)
+
+        mail = self._connect()
+        with self._lock:
+            self._handshakes += 1
+            self._in_use += 1
+        return mail
+
+    def _checkin(self, mail: imaplib.IMAP4):
+        try:
+            if mail.state == 'SELECTED':
+                mail.close()
+        except CONNECTION_ERRORS:
+            self._discard(mail)
+            return
+        except imaplib.IMAP4.error:
+            pass
+
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.max_size:
+                self._idle.append((mail, time.monotonic()))
+                return
+        self._logout(mail)
+
+    def _discard(self, mail: imaplib.IMAP4):
+        with self._lock:
+            self._in_use -= 1
+        self._logout(mail)
+
+    def _noop(self, mail: imaplib.IMAP4) -> bool:
+        try:
+            mail.noop()
+            return True
+        except Exception:
+            return False
+
+    def _logout(self, mail: imaplib.IMAP4):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self) -> Iterator[imaplib.IMAP4]:
+        """Borrow an authenticated session, returning it to the pool afterwards"""
+        mail = self._checkout()
+        try:
+            yield mail
+        except CONNECTION_ERRORS:
+            self._discard(mail)
+            raise
+        except BaseException:
+            self._checkin(mail)
+            raise
+        else:
+            self._checkin(mail)
+
+    def run(self, operation: Callable[[imaplib.IMAP4], T]) -> T:
+        """Run an idempotent operation, retrying once on a fresh session if the connection drops"""
+        try:
+            with self.session() as mail:
+                return operation(mail)
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"IMAP session dropped ({str(e)}), retrying on a new session")
+            with self._lock:
+                self._reconnects += 1
+            with self.session() as mail:
+                return operation(mail)
+
+    def keepalive(self):
+        """Send NOOP on idle sessions so the server doesn't time them out"""
+        with self._lock:
+            due = [entry for entry in self._idle if time.monotonic() - entry[1] >= self.keepalive_interval]
+            for entry in due:
+                self._idle.remove(entry)
+
+        for mail, _ in due:
+            if self._noop(mail):
+                with self._lock:
+                    self._keepalives += 1
+                    if len(self._idle) < self.max_size:
+                        self._idle.append((mail, time.monotonic()))
+                        continue
+            self._logout(mail)
+
+    def start_keepalive(self):
+        """Start a background thread that keeps idle sessions alive"""
+        if self._keepalive_thread:
+            return
+
+        def loop():
+            while not self._stop.wait(self.keepalive_interval / 2):
+                self.keepalive()
+
+        self._keepalive_thread = threading.Thread(target=loop, name='imap-keepalive', daemon=True)
+        self._keepalive_thread.start()
+
+    def close(self):
+        """Log out every idle session"""
+        self._stop.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail, _ in idle:
+            self._logout(mail)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool size and handshake counters"""
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "handshakes": self._handshakes,
+                "handshakes_saved": self._reuses,
+                "reconnects": self._reconnects,
+                "keepalives": self._keepalives
+            }
@@ -0,0 +1,36 @@
+import logging
+import sys
+from database import Database
+
+logging.basicConfig(level=logging.WARNING)
+
+def print_report(report):
+    """Print one line per query shape"""
+    width = max(len(entry["query"]) for entry in report)
+    for entry in report:
+        flag = "COLLSCAN" if entry["collscan"] else ("SORT" if entry["in_memory_sort"] else "ok")
+        print(
+            f"{entry['query']:<{width}}  {flag:<8}  "
+            f"keys={entry['keys_examined']} docs={entry['docs_examined']} returned={entry['returned']}  "
+            f"{' > '.join(entry['stages'])}  [{', '.join(entry['indexes']) or 'no index'}]"
+        )
+
+def main() -> int:
+    """Explain every Database query shape and fail if any scans the whole collection"""
+    db = Database()
+    db.connect()
+    try:
+        report = db.explain_queries()
+    finally:
+        db.close()
+
+    print_report(report)
+    collscans = [entry["query"] for entry in report if entry["collscan"]]
+    if collscans:
+        print(f"\n{len(collscans)} queries use a collection scan: {', '.join(collscans)}")
+        return 1
+    print("\nAll queries are served by an index")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IngestionWorker:
+    """Runs email ingestion work off the asyncio event loop"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv('INGESTION_WORKERS', '4'))
+        # Polls get their own thread so the per-email tasks they fan out to the
+        # worker pool can never be starved by the poll waiting on them
+        self._poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-poll')
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingest')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._polls = 0
+        self._polling = False
+        self._last_poll_seconds: Optional[float] = None
+        logger.info(f"Ingestion worker started with {self.max_workers} workers")
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a task on the worker pool"""
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._run_task, fn, args, kwargs)
+
+    def _run_task(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def run_poll(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a poll on the dedicated poll thread without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._poll_executor,
+            functools.partial(self._run_poll, fn, *args, **kwargs)
+        )
+
+    async def run_wait(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking wait between polls (such as IMAP IDLE) on the poll thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._poll_executor, functools.partial(fn, *args, **kwargs))
+
+    def _run_poll(self, fn: Callable, *args, **kwargs) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            self._polling = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._polling = False
+                self._polls += 1
+                self._last_poll_seconds = time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth, in-flight count and totals"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "polls": self._polls,
+                "polling": self._polling,
+                "last_poll_seconds": self._last_poll_seconds
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and release worker threads"""
+        self._poll_executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info("Ingestion worker stopped")
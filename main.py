@@ -1,15 +1,23 @@
 import os
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, UploadFile, File, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 import uvicorn
 import asyncio
+import json
 import logging
-from email_monitor import EmailMonitor
-from document_processor import DocumentProcessor
-from database import Database, DocumentModel
+from concurrent.futures import Future, as_completed
+from email_monitor import EmailMonitor, AdaptivePollInterval, AttachmentBudget
+from async_database import AsyncDatabase
+from document_cache import DocumentCache
+from mongo_monitoring import MongoMetrics
+from database import Database, DocumentModel, DocumentWriteBuffer, JSONEncoder, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_BULK_STATUS_UPDATES
+from ingestion_worker import IngestionWorker
+from ocr_engine import OCREngine, OCRJob
+from ocr_cache import OCRCache
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -26,58 +34,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
-email_monitor = EmailMonitor()
-document_processor = DocumentProcessor()
-db = Database()
-db.connect()
+# Components that connect to Mongo or IMAP or start threads are created on
+# startup, not at import: OCR worker processes start with forkserver/spawn and
+# re-import this module when it is run as a script
+email_monitor: Optional[EmailMonitor] = None
+document_cache: Optional[DocumentCache] = None
+db: Optional[Database] = None
+async_db: Optional[AsyncDatabase] = None
+document_buffer: Optional[DocumentWriteBuffer] = None
+ocr_cache: Optional[OCRCache] = None
+ocr_engine: Optional[OCREngine] = None
+
+# Ingestion runs in its own worker pool so polls never block API requests
+ingestion_worker = IngestionWorker()
+
+# Caps attachment bytes downloaded but not yet processed
+attachment_budget = AttachmentBudget(int(os.getenv('INGESTION_MAX_INFLIGHT_BYTES', str(256 * 1024 * 1024))))
+
+# Text completions in progress by document id, so concurrent requests for the
+# text of one document share a single OCR run
+text_completions: Dict[str, asyncio.Task] = {}
+
+def create_components():
+    """Connect to Mongo and IMAP and start the ingestion components"""
+    global email_monitor, document_cache, db, async_db, document_buffer, ocr_cache, ocr_engine
+    email_monitor = EmailMonitor()
+    # Detail views are served from memory; both clients invalidate it on writes
+    document_cache = DocumentCache()
+    # Each client has its own pool, so each gets its own latency and pool metrics
+    db = Database(document_cache=document_cache, metrics=MongoMetrics())
+    db.connect()
+    if os.getenv('DOCUMENT_CACHE_CHANGE_STREAM', 'false').lower() == 'true':
+        document_cache.watch(db.db.documents)
+
+    # API handlers use the async client so they never tie up the threadpool;
+    # ingestion keeps the synchronous one
+    async_db = AsyncDatabase(blob_store=db.blob_store, document_cache=document_cache, metrics=MongoMetrics())
+
+    # Processed documents are written in bulk rather than one insert each
+    document_buffer = DocumentWriteBuffer(db)
+
+    # OCR runs in worker processes to use every core; attachments seen before skip OCR
+    ocr_cache = OCRCache(db.db.ocr_cache, max_entries=int(os.getenv('OCR_CACHE_SIZE', '1024')))
+    ocr_engine = OCREngine(cache=ocr_cache)
+
+def process_email(email) -> List[Future]:
+    """Process every supported attachment of a single email, returning the writes of its documents"""
+    logger.info(f"Processing email with subject: {email.subject}")
+    
+    # OCR all attachments in parallel and store them as they finish
+    jobs = [
+        OCRJob(
+            content=attachment.content,
+            content_type=attachment.content_type,
+            subject=email.subject,
+            sender=email.sender,
+            filename=attachment.filename
+        )
+        for attachment in email.attachments
+    ]
+    writes = []
+    for result in ocr_engine.process_batch(jobs):
+        logger.info(f"Processed attachment {result.job.filename} in {result.seconds:.2f}s{' (cached)' if result.cached else ''}")
+        
+        # Upload the attachment here on the worker thread, so the bulk write
+        # only inserts documents instead of waiting on one upload per document
+        original = db.blob_store.put(result.job.content, result.job.content_type) if result.job.content else None
+
+        # Queue the processed document for the next bulk write
+        writes.append(document_buffer.add(
+            email_id=email.id,
+            extracted_data=result.data,
+            original=original,
+            content_type=result.job.content_type,
+            subject=email.subject,
+            sender=email.sender
+        ))
+    return writes
+
+def documents_stored(email_id: str, writes: List[Future]) -> bool:
+    """Whether every document of an email was inserted (or already existed) after a flush"""
+    for write in writes:
+        try:
+            result = write.result()
+        except Exception as e:
+            logger.error(f"Documents of email {email_id} were not stored, leaving it in the inbox: {str(e)}")
+            return False
+        if result["status"] == "error":
+            logger.error(f"Documents of email {email_id} were not stored, leaving it in the inbox: {result.get('error')}")
+            return False
+    return True
 
 # Background task to check emails periodically
-def check_emails():
+def check_emails() -> int:
+    """Run one ingestion pass, returning the number of new emails found"""
     try:
         logger.info("Checking for new emails...")
-        # Check for new emails
-        new_emails = email_monitor.check_new_emails()
-        logger.info(f"Found {len(new_emails)} new emails")
+        found = 0
+        writes = {}
+        futures = {}
+        
+        # Stream emails to the worker pool as they download; the budget stops
+        # the download from running ahead of processing
+        for email in email_monitor.iter_new_emails(budget=attachment_budget):
+            found += 1
+            future = ingestion_worker.submit(process_email, email)
+            future.add_done_callback(lambda _, size=email.size: attachment_budget.release(size))
+            futures[future] = email.id
+        logger.info(f"Found {found} new emails")
         
-        for email in new_emails:
+        # Only ids are kept here so attachment bytes are freed as emails finish
+        for future in as_completed(futures):
+            email_id = futures[future]
             try:
-                logger.info(f"Processing email with subject: {email.subject}")
-                
-                # Process attachments
-                if email.attachments:
-                    for attachment in email.attachments:
-                        logger.info(f"Processing attachment: {attachment.filename}")
-                        doc_data = document_processor.process_document(
-                            attachment.content,
-                            attachment.content_type,
-                            email.subject,
-                            email.sender
-                        )
-                        
-                        # Store the processed document
-                        try:
-                            db.store_document(
-                                email_id=email.id,
-                                extracted_data=doc_data,
-                                original_content=attachment.content,
-                                content_type=attachment.content_type,
-                                subject=email.subject,
-                                sender=email.sender
-                            )
-                            logger.info(f"Successfully stored document from email {email.id}")
-                        except Exception as e:
-                            logger.error(f"Failed to store document from email {email.id}: {str(e)}")
-                
-                # Mark email as processed
-                email_monitor.mark_as_processed(email.id)
-                logger.info(f"Marked email as processed: {email.id}")
-                
+                writes[email_id] = future.result()
             except Exception as e:
-                logger.error(f"Error processing email {email.id}: {str(e)}")
+                logger.error(f"Error processing email {email_id}: {str(e)}")
                 continue
+        
+        # Documents must be written before their emails leave the inbox; once
+        # this flush returns every queued write has its result
+        document_buffer.flush()
+        processed_ids = [email_id for email_id, email_writes in writes.items() if documents_stored(email_id, email_writes)]
+        
+        # Mark all processed emails in one batch
+        if processed_ids and email_monitor.mark_as_processed_batch(processed_ids):
+            logger.info(f"Marked {len(processed_ids)} emails as processed")
+        return found
     except Exception as e:
         logger.error(f"Error in check_emails: {str(e)}")
+        return 0
 
 # Pydantic models for API
 class DocumentUpdate(BaseModel):
@@ -85,6 +171,12 @@ class DocumentUpdate(BaseModel):
     accounting_entry: Optional[Dict] = None
     corrections: Optional[Dict] = None
 
+class StatusUpdate(BaseModel):
+    id: str
+    status: str
+    accounting_entry: Optional[Dict] = None
+    corrections: Optional[Dict] = None
+
 class DateRange(BaseModel):
     start_date: datetime
     end_date: datetime
@@ -92,47 +184,208 @@ class DateRange(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Run on startup"""
+    create_components()
+    await async_db.connect()
     # Start email checking in background
     asyncio.create_task(check_emails_periodically())
+    asyncio.create_task(reconcile_stats_periodically())
 
 async def check_emails_periodically():
-    """Periodically check for new emails"""
+    """Check for new emails, waking on IMAP IDLE pushes or adaptive polling"""
+    poll_interval = AdaptivePollInterval()
     while True:
         try:
-            check_emails()
-            await asyncio.sleep(60)  # Check every minute
+            found = await ingestion_worker.run_poll(check_emails)
+            if await ingestion_worker.run_wait(email_monitor.supports_idle):
+                await ingestion_worker.run_wait(email_monitor.wait_for_new_mail)
+            else:
+                await asyncio.sleep(poll_interval.next(found > 0))
         except Exception as e:
             logger.error(f"Error in periodic email check: {str(e)}")
             await asyncio.sleep(60)  # Wait before retrying
 
+async def reconcile_stats_periodically():
+    """Recount document stats on startup and then every STATS_RECONCILE_INTERVAL seconds"""
+    interval = float(os.getenv('STATS_RECONCILE_INTERVAL', '3600'))
+    while True:
+        try:
+            await asyncio.to_thread(db.reconcile_stats)
+        except Exception as e:
+            logger.error(f"Error reconciling document stats: {str(e)}")
+        await asyncio.sleep(interval)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    # Closing the monitor first wakes the poll thread out of IDLE
+    email_monitor.close()
+    ingestion_worker.shutdown(wait=False)
+    ocr_engine.shutdown(wait=False)
+    document_buffer.close()
+    document_cache.close()
+    async_db.close()
     db.close()
 
 @app.get("/documents/pending")
-def get_pending_documents(limit: int = 10):
+async def get_pending_documents(limit: int = 10):
     """Get pending documents"""
     try:
-        documents = db.get_pending_documents(limit)
+        documents = await async_db.get_pending_documents(limit, view="summary")
         return {"documents": documents}
     except Exception as e:
         logger.error(f"Error fetching pending documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documents/search")
+async def search_documents(
+    vendor_name: Optional[str] = None,
+    invoice_number: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    status: Optional[str] = None,
+    vendor_match: str = Query("prefix", pattern="^(prefix|exact|text)$"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    """Search documents based on criteria, newest first
+
+    Returns one page plus a cursor for the next page, or with stream=true
+    every match as newline-delimited JSON.
+    """
+    date_range = None
+    if start_date and end_date:
+        date_range = (start_date, end_date)
+    
+    if stream:
+        documents = async_db.iter_search_documents(
+            vendor_name=vendor_name,
+            invoice_number=invoice_number,
+            date_range=date_range,
+            status=status,
+            vendor_match=vendor_match,
+            view="summary"
+        )
+        return StreamingResponse(
+            (json.dumps(document, cls=JSONEncoder) + "\n" async for document in documents),
+            media_type="application/x-ndjson"
+        )
+    
+    try:
+        documents, next_cursor = await async_db.search_documents(
+            vendor_name=vendor_name,
+            invoice_number=invoice_number,
+            date_range=date_range,
+            status=status,
+            vendor_match=vendor_match,
+            view="summary",
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"documents": documents, "next_cursor": next_cursor}
+
 @app.get("/documents/{document_id}")
-def get_document(document_id: str):
+async def get_document(document_id: str, view: str = Query("detail", pattern="^(summary|detail)$")):
     """Get specific document by ID"""
-    document = db.get_document_by_id(document_id)
+    document = await async_db.get_document_by_id(document_id, view=view)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     return document
 
+@app.get("/documents/{document_id}/original")
+async def get_document_original(document_id: str):
+    """Download the original attachment of a document"""
+    try:
+        original = await async_db.get_original_content(document_id)
+    except Exception as e:
+        logger.error(f"Error loading original content: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not original:
+        raise HTTPException(status_code=404, detail="Original content not found")
+    content, content_type = original
+    return Response(content=content, media_type=content_type)
+
+@app.get("/documents/{document_id}/text")
+async def get_document_text(document_id: str):
+    """Get the full text of a document, OCRing any pages early exit skipped"""
+    document = await async_db.get_document_by_id(document_id, view="detail")
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if document.get("text_complete", True):
+        return {
+            "document_id": document_id,
+            "text": document.get("text", ""),
+            "text_complete": True,
+            "pages_processed": document.get("pages_processed"),
+            "pages_total": document.get("pages_total")
+        }
+
+    completion = text_completions.get(document_id)
+    if completion is None:
+        completion = asyncio.ensure_future(complete_text(document_id, document))
+        text_completions[document_id] = completion
+        completion.add_done_callback(lambda _: text_completions.pop(document_id, None))
+    # A client that disconnects doesn't cancel the run the others wait on
+    return await asyncio.shield(completion)
+
+async def complete_text(document_id: str, document: Dict) -> Dict:
+    """OCR the pages early exit skipped and store the full text of a document"""
+    original = await async_db.get_original_content(document_id)
+    if not original:
+        raise HTTPException(status_code=404, detail="Original content not found")
+    content, content_type = original
+    # Documents stored before skipped pages were recorded are OCR'd in full
+    partial = None
+    if document.get("skipped_pages") and document.get("page_offsets"):
+        partial = {
+            key: document.get(key)
+            for key in ("text", "skipped_pages", "page_offsets", "pages_total", "text_source")
+        }
+    result = await ocr_engine.process(OCRJob(
+        content=content,
+        content_type=content_type,
+        subject=document.get("email_subject") or "",
+        sender=document.get("email_sender") or "",
+        early_exit=False,
+        partial=partial
+    ))
+    if result.error:
+        raise HTTPException(status_code=500, detail=f"OCR failed: {result.error}")
+
+    # Cache entries written before page counts were kept don't know them
+    pages_total = result.data.get("pages_total") or document.get("pages_total")
+    await async_db.complete_document_text(
+        document_id, result.data["text"], pages_total, result.data.get("text_source")
+    )
+    return {
+        "document_id": document_id,
+        "text": result.data["text"],
+        "text_complete": True,
+        "pages_processed": pages_total,
+        "pages_total": pages_total
+    }
+
+@app.post("/documents/status")
+async def update_document_statuses(updates: List[StatusUpdate]):
+    """Update the status of many documents in one bulk write"""
+    if len(updates) > MAX_BULK_STATUS_UPDATES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_STATUS_UPDATES} updates per request")
+    try:
+        results = await async_db.update_document_statuses_bulk([update.model_dump() for update in updates])
+    except Exception as e:
+        logger.error(f"Error updating document statuses: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    updated = sum(1 for result in results if result["status"] == "updated")
+    return {"updated": updated, "results": results}
+
 @app.post("/documents/{doc_id}/status/{status}")
-def update_document_status(doc_id: str, status: str):
+async def update_document_status(doc_id: str, status: str):
     """Update document status"""
     try:
-        success = db.update_document_status(doc_id, status)
+        success = await async_db.update_document_status(doc_id, status)
         if not success:
             raise HTTPException(status_code=404, detail="Document not found")
         return {"message": "Status updated successfully"}
@@ -140,36 +393,57 @@ def update_document_status(doc_id: str, status: str):
         logger.error(f"Error updating document status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/documents/search")
-def search_documents(
-    vendor_name: Optional[str] = None,
-    invoice_number: Optional[str] = None,
-    start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None,
-    status: Optional[str] = None
-):
-    """Search documents based on criteria"""
-    date_range = None
-    if start_date and end_date:
-        date_range = (start_date, end_date)
+@app.post("/documents/upload")
+async def upload_document(file: UploadFile = File(...)):
+    """OCR an uploaded document and store it for review"""
+    content = await file.read()
+    result = await ocr_engine.process(OCRJob(
+        content=content,
+        content_type=file.content_type or "application/octet-stream",
+        filename=file.filename
+    ))
+    if result.error:
+        raise HTTPException(status_code=500, detail=f"OCR failed: {result.error}")
+    if not result.data:
+        raise HTTPException(status_code=400, detail="No text could be extracted from document")
     
-    documents = db.search_documents(
-        vendor_name=vendor_name,
-        invoice_number=invoice_number,
-        date_range=date_range,
-        status=status
+    document_id = await async_db.store_document(
+        email_id=f"upload:{file.filename}",
+        extracted_data=result.data,
+        original_content=content,
+        content_type=result.job.content_type
     )
-    
-    return {"documents": documents}
+    return {"document_id": document_id}
 
 @app.get("/stats")
-def get_stats():
+async def get_stats():
     """Get document processing statistics"""
     try:
-        return db.get_document_stats()
+        return await async_db.get_document_stats()
     except Exception as e:
         logger.error(f"Error fetching stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/db/metrics")
+async def get_db_metrics():
+    """Get Mongo command latency, pool checkout waits and document cache counters"""
+    return {
+        "sync": db.metrics.snapshot(),
+        "async": async_db.metrics.snapshot(),
+        "document_cache": document_cache.stats()
+    }
+
+@app.get("/ingestion/status")
+async def get_ingestion_status():
+    """Get email ingestion worker status"""
+    return {
+        "worker": ingestion_worker.stats(),
+        "ocr": ocr_engine.stats(),
+        "imap": email_monitor.pool.stats(),
+        "email_fetch": email_monitor.fetch_stats,
+        "attachment_budget": attachment_budget.stats(),
+        "document_buffer": document_buffer.stats()
+    }
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
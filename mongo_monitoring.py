@@ -0,0 +1,200 @@
+import bisect
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of observations"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds_ms, self.counts):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}ms": count for bound, count in zip(self.bounds_ms, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": buckets
+        }
+
+class CommandLatencyListener(monitoring.CommandListener):
+    """Records server round-trip latency per command name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, LatencyHistogram] = {}
+        self._failures: Dict[str, int] = {}
+
+    def _observe(self, command_name: str, duration_micros: int) -> None:
+        with self._lock:
+            histogram = self._latency.get(command_name)
+            if histogram is None:
+                histogram = self._latency[command_name] = LatencyHistogram()
+            histogram.observe(duration_micros / 1000)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event.command_name, event.duration_micros)
+
+    def failed(self, event):
+        self._observe(event.command_name, event.duration_micros)
+        with self._lock:
+            self._failures[event.command_name] = self._failures.get(event.command_name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {**histogram.snapshot(), "failures": self._failures.get(name, 0)}
+                for name, histogram in sorted(self._latency.items())
+            }
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """Records how long operations wait to check a connection out of the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Checkout start and end are published on the thread doing the checkout
+        self._local = threading.local()
+        self._wait = LatencyHistogram()
+        self._checkout_failures: Dict[str, int] = {}
+        self._in_use = 0
+        self._created = 0
+        self._closed = 0
+        self._cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._closed += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _waited_ms(self) -> float:
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_failed(self, event):
+        waited = self._waited_ms()
+        with self._lock:
+            self._wait.observe(waited)
+            self._checkout_failures[event.reason] = self._checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        waited = self._waited_ms()
+        with self._lock:
+            self._wait.observe(waited)
+            self._in_use += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._in_use -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkout_wait": self._wait.snapshot(),
+                "checkout_failures": dict(self._checkout_failures),
+                "in_use": self._in_use,
+                "connections_created": self._created,
+                "connections_closed": self._closed,
+                "pool_cleared": self._cleared
+            }
+
+class MongoMetrics:
+    """Command latency and pool wait listeners for one client"""
+
+    def __init__(self):
+        self.commands = CommandLatencyListener()
+        self.pool = PoolWaitListener()
+
+    def listeners(self) -> List[Any]:
+        return [self.commands, self.pool]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "commands": self.commands.snapshot(),
+            "pool": self.pool.snapshot()
+        }
+
+# Environment variables mapped to MongoClient options
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+}
+
+def client_options(metrics: Optional[MongoMetrics] = None) -> Dict[str, Any]:
+    """MongoClient keyword arguments from the environment, shared by the sync and async clients
+
+    Options that aren't set keep the driver defaults. zstd and snappy
+    compression need the zstandard and python-snappy packages.
+    """
+    options = {}
+    for variable, (option, convert) in CLIENT_OPTIONS.items():
+        value = os.getenv(variable)
+        if value:
+            options[option] = convert(value)
+    if metrics is not None:
+        options["event_listeners"] = metrics.listeners()
+    return options
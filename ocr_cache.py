@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields of a cache entry read back from Mongo
+CACHE_PROJECTION = {
+    "text": 1,
+    "content_type": 1,
+    "text_source": 1,
+    "pages_total": 1,
+    "pages_processed": 1,
+    "text_complete": 1,
+    "skipped_pages": 1,
+    "page_offsets": 1
+}
+
+class OCRCache:
+    """OCR text keyed by attachment hash, with an in-memory LRU in front of a Mongo collection"""
+
+    def __init__(self, collection=None, max_entries: int = 1024):
+        self.collection = collection
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._store_hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(content: bytes, config_version: str) -> str:
+        """Key an attachment by its content hash and the OCR configuration"""
+        return f"{hashlib.sha256(content).hexdigest()}:{config_version}"
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached OCR result, checking memory before Mongo"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+                return entry
+
+        entry = None
+        if self.collection is not None:
+            try:
+                entry = self.collection.find_one({"_id": key}, CACHE_PROJECTION)
+            except Exception as e:
+                logger.warning(f"OCR cache lookup failed: {str(e)}")
+
+        if entry is None:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        self._remember(key, entry)
+        with self._lock:
+            self._store_hits += 1
+        return entry
+
+    def put(self, key: str, text: str, content_type: str, text_source: Optional[str] = None,
+            pages_total: Optional[int] = None, pages_processed: Optional[int] = None,
+            skipped_pages: Optional[List[int]] = None, page_offsets: Optional[List[int]] = None):
+        """Cache the extracted text of an attachment
+
+        Text cut short by early exit is cached with the pages it skipped and
+        where each page starts; a later put of the full text replaces it.
+        """
+        entry = {
+            "_id": key,
+            "text": text,
+            "content_type": content_type,
+            "text_source": text_source,
+            "pages_total": pages_total,
+            "pages_processed": pages_processed,
+            "text_complete": pages_total is None or pages_processed is None or pages_processed >= pages_total,
+            "skipped_pages": skipped_pages or [],
+            "page_offsets": page_offsets if skipped_pages else None
+        }
+        self._remember(key, entry)
+        if self.collection is None:
+            return
+        try:
+            self.collection.replace_one(
+                {"_id": key},
+                {**entry, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Failed to persist OCR cache entry: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit and miss counters"""
+        with self._lock:
+            hits = self._memory_hits + self._store_hits
+            lookups = hits + self._misses
+            return {
+                "entries_in_memory": len(self._entries),
+                "memory_hits": self._memory_hits,
+                "store_hits": self._store_hits,
+                "hits": hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,296 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_for_futures
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from document_processor import DocumentProcessor, OCRTimeoutError
+from ocr_cache import OCRCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Workers start from a fresh interpreter instead of forking this process,
+# whose IMAP keepalive, buffer flusher and pymongo threads may hold locks
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Seconds past the job deadline before a worker that hasn't given up is abandoned
+JOB_TIMEOUT_GRACE = 10.0
+
+@dataclass
+class OCRJob:
+    content: bytes
+    content_type: str
+    subject: str = ""
+    sender: str = ""
+    filename: Optional[str] = None
+    # Overrides OCR_EARLY_EXIT; False OCRs every page
+    early_exit: Optional[bool] = None
+    # An early exit result of this PDF to complete by OCRing only the pages
+    # it skipped (see DocumentProcessor.complete_pdf)
+    partial: Optional[Dict[str, Any]] = None
+
+@dataclass
+class OCRResult:
+    job: OCRJob
+    data: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    seconds: float = 0.0
+    cached: bool = False
+
+# Each worker process keeps its own processor between tasks
+_worker_processor: Optional[DocumentProcessor] = None
+
+def _init_worker():
+    global _worker_processor
+    # Tesseract's OpenMP threads would multiply with the worker processes
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    _worker_processor = DocumentProcessor()
+
+def _run_task(time_left: float, method: str, *args) -> Any:
+    """Run one processor method in a worker, within the time its job has left"""
+    # The deadline covers the whole job, however many tasks and subprocesses it takes
+    _worker_processor.deadline = time.monotonic() + time_left
+    try:
+        return getattr(_worker_processor, method)(*args)
+    finally:
+        _worker_processor.deadline = None
+
+class OCREngine:
+    """Runs document OCR in a pool of worker processes
+
+    An image is one task. A PDF is split into pages in this process, which
+    also reads its text layer, and every page left to OCR is a task of its
+    own, so a long scan spreads over all idle workers rather than one.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, job_timeout: Optional[float] = None,
+                 cache: Optional[OCRCache] = None):
+        self.cache = cache
+        # Splits PDFs into page tasks and runs the regex extractors, including
+        # those of cache hits, in this process
+        self._processor = DocumentProcessor()
+        self.max_workers = max_workers or int(os.getenv('OCR_WORKERS', str(os.cpu_count() or 1)))
+        self.job_timeout = job_timeout or float(os.getenv('OCR_JOB_TIMEOUT', '300'))
+        self._executor = self._new_executor()
+        # One slot per worker process, held by a task until it finishes
+        self._slots = threading.Semaphore(self.max_workers)
+        # Jobs in progress wait on their own tasks here. Capping them at the
+        # worker count keeps a job's deadline from counting the time it sits
+        # behind other jobs before it starts.
+        self._jobs = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ocr-job')
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._abandoned = 0
+        self._pool_restarts = 0
+        self._in_flight = 0
+        self._tasks = 0
+        logger.info(f"OCR engine started with {self.max_workers} worker processes")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(START_METHOD),
+            initializer=_init_worker
+        )
+
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor):
+        """Start a new process pool after a worker died, unless another thread already did"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self._pool_restarts += 1
+        logger.error("An OCR worker process died; started a new process pool")
+
+    def _submit(self, deadline: float, method: str, *args) -> Future:
+        """Run a processor method in a worker once a slot is free, or fail at the job deadline"""
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise OCRTimeoutError("OCR job deadline passed while waiting for a worker")
+        try:
+            executor = self._executor
+            task = (_run_task, max(0.0, deadline - time.monotonic()), method) + args
+            try:
+                future = executor.submit(*task)
+            except BrokenProcessPool:
+                self._replace_broken_pool(executor)
+                executor = self._executor
+                future = executor.submit(*task)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._tasks += 1
+        future.add_done_callback(lambda done: self._task_done(done, executor))
+        return future
+
+    def _task_done(self, future: Future, executor: ProcessPoolExecutor):
+        self._slots.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace_broken_pool(executor)
+
+    def _wait(self, job: OCRJob, future: Future, deadline: float) -> Any:
+        """Get a task's result, giving up on a worker still busy well past the job deadline"""
+        limit = max(0.0, deadline - time.monotonic()) + JOB_TIMEOUT_GRACE
+        done, _ = wait_for_futures([future], timeout=limit)
+        if not done:
+            # The worker gives up at its own deadline; one still running past
+            # the grace period is stuck outside OCR. Its slot stays taken until
+            # it returns, so the pool isn't oversubscribed.
+            self._abandon(job)
+            raise OCRTimeoutError("OCR worker did not return after the job deadline")
+        return future.result()
+
+    def _process_pdf(self, job: OCRJob, deadline: float) -> Dict[str, Any]:
+        """Read a PDF's layout and text layer here and OCR its remaining pages in the workers"""
+        # A copy per job, since each job has its own deadline
+        processor = copy.copy(self._processor)
+        processor.deadline = deadline
+
+        def ocr_batch(page_numbers: List[int]) -> List[Dict]:
+            # Every page goes out before waiting on any, so the batch runs on all idle workers
+            futures = [self._submit(deadline, 'ocr_pdf_page', job.content, page_number) for page_number in page_numbers]
+            return [self._wait(job, future, deadline) for future in futures]
+
+        if job.partial:
+            return processor.complete_pdf(job.content, job.partial, job.subject, job.sender, ocr_batch)
+        # With early exit, a batch is one page per worker before checking the fields found so far
+        return processor.process_pdf(
+            job.content, job.subject, job.sender, job.early_exit, ocr_batch, batch_size=self.max_workers
+        )
+
+    def _run_job(self, job: OCRJob, key: Optional[str]) -> OCRResult:
+        """Run a job to completion on a job thread"""
+        started = time.monotonic()
+        deadline = started + self.job_timeout
+        with self._lock:
+            self._submitted += 1
+            self._in_flight += 1
+        error = None
+        try:
+            if job.content_type == 'application/pdf':
+                data = self._process_pdf(job, deadline)
+            else:
+                future = self._submit(
+                    deadline, 'process_document', job.content, job.content_type, job.subject, job.sender, job.early_exit
+                )
+                data = self._wait(job, future, deadline)
+            result = OCRResult(job=job, data=data, seconds=time.monotonic() - started)
+            self._remember(key, result)
+            return result
+        except Exception as e:
+            error = e
+            return OCRResult(job=job, error=self._result_error(job, e), seconds=time.monotonic() - started)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if isinstance(error, OCRTimeoutError):
+                    self._timed_out += 1
+                elif error is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    def _result_error(self, job: OCRJob, error: BaseException) -> str:
+        if isinstance(error, OCRTimeoutError):
+            logger.error(f"OCR job for {job.filename or job.content_type} timed out after {self.job_timeout}s")
+            return "timeout"
+        logger.error(f"OCR job for {job.filename or job.content_type} failed: {str(error)}")
+        return str(error)
+
+    def _lookup(self, job: OCRJob) -> Tuple[Optional[str], Optional[OCRResult]]:
+        """Get the cache key for a job and its result if the attachment was seen before"""
+        if self.cache is None:
+            return None, None
+        started = time.monotonic()
+        key = OCRCache.make_key(job.content, self._processor.ocr_config_version())
+        entry = self.cache.get(key)
+        if entry is None:
+            return key, None
+        early_exit = self._processor.early_exit if job.early_exit is None else job.early_exit
+        if not entry.get("text_complete", True) and (job.partial or not early_exit):
+            # Early exit text can't serve a job that needs every page; the full
+            # result replaces it in the cache
+            return key, None
+        data = self._processor.extract_fields(
+            entry["text"], job.content_type, job.subject, job.sender,
+            text_source=entry.get("text_source"),
+            pages_total=entry.get("pages_total"),
+            pages_processed=entry.get("pages_processed"),
+            skipped_pages=entry.get("skipped_pages"),
+            page_offsets=entry.get("page_offsets")
+        )
+        return key, OCRResult(job=job, data=data, seconds=time.monotonic() - started, cached=True)
+
+    def _remember(self, key: Optional[str], result: OCRResult):
+        if key and not result.error and result.data.get('text'):
+            self.cache.put(
+                key,
+                result.data['text'],
+                result.job.content_type,
+                result.data.get('text_source'),
+                result.data.get('pages_total'),
+                result.data.get('pages_processed'),
+                result.data.get('skipped_pages'),
+                result.data.get('page_offsets')
+            )
+
+    def process_batch(self, jobs: Iterable[OCRJob]) -> Iterator[OCRResult]:
+        """Process a batch of jobs, yielding results in completion order"""
+        futures = []
+        for job in jobs:
+            key, cached = self._lookup(job)
+            if cached:
+                yield cached
+                continue
+            futures.append(self._jobs.submit(self._run_job, job, key))
+        for future in as_completed(futures):
+            yield future.result()
+
+    async def process(self, job: OCRJob) -> OCRResult:
+        """Process a single job without blocking the event loop"""
+        key, cached = await asyncio.to_thread(self._lookup, job)
+        if cached:
+            return cached
+        return await asyncio.wrap_future(self._jobs.submit(self._run_job, job, key))
+
+    def _abandon(self, job: OCRJob):
+        with self._lock:
+            self._abandoned += 1
+        logger.error(
+            f"OCR job for {job.filename or job.content_type} still running {JOB_TIMEOUT_GRACE}s "
+            f"past its {self.job_timeout}s deadline, abandoned"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Get OCR engine counters"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "job_timeout": self.job_timeout,
+                "submitted": self._submitted,
+                "tasks": self._tasks,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "abandoned": self._abandoned,
+                "pool_restarts": self._pool_restarts,
+                "cache": self.cache.stats() if self.cache is not None else None
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        self._jobs.shutdown(wait=wait, cancel_futures=True)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info("OCR engine stopped")
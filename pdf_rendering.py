@@ -0,0 +1,39 @@
+import io
+import re
+import subprocess
+from typing import List, Optional
+
+from PIL import Image
+
+# Poppler's command line tools read the PDF from stdin when given "-", so
+# nothing is written to disk and each call holds at most one rendered page
+
+def _run(args: List[str], pdf_data: bytes, timeout: Optional[float] = None) -> bytes:
+    result = subprocess.run(args, input=pdf_data, capture_output=True, timeout=timeout, check=True)
+    return result.stdout
+
+def pdf_page_count(pdf_data: bytes, timeout: Optional[float] = None) -> int:
+    """Count the pages of a PDF with pdfinfo"""
+    info = _run(['pdfinfo', '-'], pdf_data, timeout).decode('utf-8', 'replace')
+    match = re.search(r'^Pages:\s+(\d+)', info, re.MULTILINE)
+    if not match:
+        raise ValueError("Could not read the page count of the PDF")
+    return int(match.group(1))
+
+def read_text_layer(pdf_data: bytes, page_count: int, timeout: Optional[float] = None) -> List[str]:
+    """Read the embedded text of every page with pdftotext"""
+    text = _run(['pdftotext', '-enc', 'UTF-8', '-', '-'], pdf_data, timeout).decode('utf-8', 'replace')
+    # pdftotext ends every page with a form feed
+    pages = text.split('\f')[:page_count]
+    return pages + [''] * (page_count - len(pages))
+
+def render_page(pdf_data: bytes, page_number: int, dpi: int = 200, grayscale: bool = False,
+                timeout: Optional[float] = None) -> Image.Image:
+    """Render a single page to an image with pdftoppm"""
+    args = ['pdftoppm', '-f', str(page_number), '-l', str(page_number), '-r', str(dpi), '-png']
+    if grayscale:
+        args.append('-gray')
+    png = _run(args + ['-'], pdf_data, timeout)
+    image = Image.open(io.BytesIO(png))
+    image.load()
+    return image
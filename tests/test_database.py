@@ -0,0 +1,172 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from database import (
+    DUPLICATE_KEY_ERROR, Database, DocumentWriteBuffer, finish_status_updates, plan_status_updates
+)
+
+
+class FakeDocuments:
+    """Just enough of the documents collection for bulk inserts, with the unique attachment index"""
+
+    def __init__(self):
+        self.stored = {}
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            sha256 = (document.get("original") or {}).get("sha256")
+            if sha256 is not None and (document["email_id"], sha256) in self.stored:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": "E11000 duplicate key error"})
+                continue
+            self.stored[(document["email_id"], sha256 or document["_id"])] = document
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+
+class FakeStats:
+    def __init__(self):
+        self.counts = {}
+
+    def update_one(self, query, update, upsert=False):
+        for field, change in update["$inc"].items():
+            self.counts[field] = self.counts.get(field, 0) + change
+
+
+def make_database():
+    database = Database()
+    database.db = SimpleNamespace(documents=FakeDocuments(), document_stats=FakeStats())
+    return database
+
+
+def email_documents(email_id):
+    return [
+        {
+            "email_id": email_id,
+            "extracted_data": {"text": f"invoice {number}"},
+            "original": {"backend": "local", "sha256": f"{number:064x}"},
+            "content_type": "application/pdf"
+        }
+        for number in (1, 2)
+    ]
+
+
+def test_reflushed_email_is_not_inserted_twice():
+    database = make_database()
+    first = database.store_documents_bulk(email_documents("42"))
+    assert [result["status"] for result in first] == ["inserted", "inserted"]
+
+    # The email stays in the inbox after a partial failure and comes round again
+    retried = database.store_documents_bulk(email_documents("42"))
+    assert [result["status"] for result in retried] == ["duplicate", "duplicate"]
+    assert len(database.db.documents.stored) == 2
+    assert database.db.document_stats.counts == {"total": 2, "pending": 2}
+
+
+def test_same_attachment_in_another_email_is_a_new_document():
+    database = make_database()
+    database.store_documents_bulk(email_documents("42"))
+    results = database.store_documents_bulk(email_documents("43"))
+    assert [result["status"] for result in results] == ["inserted", "inserted"]
+    assert len(database.db.documents.stored) == 4
+
+
+class FakeBulkStore:
+    """Stands in for Database in the write buffer, recording each bulk store"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+
+    def store_documents_bulk(self, documents):
+        self.batches.append(documents)
+        if self.error:
+            raise self.error
+        return [
+            {"index": i, "email_id": document["email_id"], "document_id": f"doc-{i}", "status": "inserted"}
+            for i, document in enumerate(documents)
+        ]
+
+
+def test_flush_resolves_every_earlier_add():
+    store = FakeBulkStore()
+    buffer = DocumentWriteBuffer(store, max_size=100, max_delay=60)
+    try:
+        writes = [buffer.add(email_id=str(number), extracted_data={}) for number in range(3)]
+        assert not any(write.done() for write in writes)
+        buffer.flush()
+        assert [write.result(timeout=0)["email_id"] for write in writes] == ["0", "1", "2"]
+        assert len(store.batches) == 1
+        assert buffer.stats()["inserted"] == 3
+    finally:
+        buffer.close()
+
+
+def test_failed_bulk_store_fails_every_add():
+    store = FakeBulkStore(error=RuntimeError("not primary"))
+    buffer = DocumentWriteBuffer(store, max_size=100, max_delay=60)
+    try:
+        writes = [buffer.add(email_id=str(number), extracted_data={}) for number in range(2)]
+        buffer.flush()
+        for write in writes:
+            with pytest.raises(RuntimeError, match="not primary"):
+                write.result(timeout=0)
+        assert buffer.stats()["errors"] == 2
+    finally:
+        store.error = None
+        buffer.close()
+
+
+A, B, C = (ObjectId() for _ in range(3))
+
+
+def test_repeated_id_writes_only_the_last_update():
+    updates = [
+        {"id": str(A), "status": "approved"},
+        {"id": str(B), "status": "approved"},
+        {"id": str(A), "status": "rejected"}
+    ]
+    operations, op_items, results = plan_status_updates(updates, {A: "pending", B: "pending"})
+    assert [op._filter for op in operations] == [{"_id": B}, {"_id": A}]
+    assert operations[1]._doc["$set"]["status"] == "rejected"
+    assert op_items == [(1, "pending", "approved"), (2, "pending", "rejected")]
+    assert results[0] == {"index": 0, "id": str(A), "status": "superseded", "superseded_by": 2}
+    assert finish_status_updates(results, op_items, []) == {"pending": -2, "approved": 1, "rejected": 1}
+
+
+def test_invalid_and_missing_ids_get_no_operation():
+    updates = [
+        {"id": "not-an-id", "status": "approved"},
+        {"status": "approved"},
+        {"id": str(C), "status": "approved"},
+        {"id": str(A), "status": "approved"}
+    ]
+    operations, op_items, results = plan_status_updates(updates, {A: "pending"})
+    assert [result["status"] for result in results] == ["invalid_id", "invalid_id", "not_found", "updated"]
+    assert op_items == [(3, "pending", "approved")]
+    assert len(operations) == 1
+
+
+def test_unchanged_status_is_updated_without_stats_change():
+    operations, op_items, results = plan_status_updates([{"id": str(A), "status": "pending"}], {A: "pending"})
+    assert len(operations) == 1
+    assert finish_status_updates(results, op_items, []) == {}
+    assert results[0]["status"] == "updated"
+
+
+def test_write_error_maps_back_to_its_item():
+    updates = [
+        {"id": "bad", "status": "approved"},
+        {"id": str(A), "status": "approved"},
+        {"id": str(B), "status": "rejected"},
+        {"id": str(C), "status": "approved"}
+    ]
+    operations, op_items, results = plan_status_updates(updates, {A: "pending", B: "pending", C: "approved"})
+    # The write error indexes operations, which skip the invalid item
+    changes = finish_status_updates(results, op_items, [{"index": 1, "errmsg": "document failed validation"}])
+    assert [result["status"] for result in results] == ["invalid_id", "updated", "error", "updated"]
+    assert results[2]["error"] == "document failed validation"
+    assert changes == {"pending": -1, "approved": 1}
@@ -0,0 +1,43 @@
+from document_cache import DocumentCache
+
+
+def test_read_started_before_invalidation_is_not_cached():
+    cache = DocumentCache(max_entries=8, ttl=30)
+    generation = cache.generation()
+    # A status update lands while the read is in flight
+    cache.invalidate("doc")
+    cache.put("doc", "detail", {"status": "pending"}, generation)
+    assert cache.get("doc", "detail") is None
+
+
+def test_read_started_after_invalidation_is_cached():
+    cache = DocumentCache(max_entries=8, ttl=30)
+    cache.invalidate("doc")
+    generation = cache.generation()
+    cache.put("doc", "detail", {"status": "approved"}, generation)
+    assert cache.get("doc", "detail") == {"status": "approved"}
+
+
+def test_invalidating_other_documents_does_not_block_put():
+    cache = DocumentCache(max_entries=8, ttl=30)
+    generation = cache.generation()
+    cache.invalidate("other")
+    cache.put("doc", "detail", {"status": "pending"}, generation)
+    assert cache.get("doc", "detail") == {"status": "pending"}
+
+
+def test_forgotten_invalidations_still_block_older_reads():
+    cache = DocumentCache(max_entries=2, ttl=30)
+    generation = cache.generation()
+    for document_id in ("doc", "b", "c", "d"):
+        cache.invalidate(document_id)
+    cache.put("doc", "detail", {"status": "pending"}, generation)
+    assert cache.get("doc", "detail") is None
+
+
+def test_clear_blocks_reads_started_before_it():
+    cache = DocumentCache(max_entries=8, ttl=30)
+    generation = cache.generation()
+    cache.clear()
+    cache.put("doc", "detail", {}, generation)
+    assert cache.get("doc", "detail") is None
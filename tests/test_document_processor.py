@@ -0,0 +1,50 @@
+import pytest
+
+import document_processor
+from document_processor import DocumentProcessor
+
+# Page 2 and 4 have a text layer; the others need OCR
+TEXT_LAYER = ["", "Invoice INV-2041 from Acme Ltd\nTotal: 1,250.00", "", "Due date 2024-03-01\nThank you", ""]
+OCR_TEXT = {1: "ACME LTD\nscanned letterhead", 3: "line items\n2 x widgets", 5: ""}
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(document_processor, "pdf_page_count", lambda pdf_data, timeout=None: len(TEXT_LAYER))
+    monkeypatch.setattr(document_processor, "read_text_layer", lambda pdf_data, page_count, timeout=None: TEXT_LAYER)
+    monkeypatch.setenv("OCR_EARLY_EXIT_FIELDS", "amounts")
+    monkeypatch.setenv("OCR_EARLY_EXIT_CONFIDENCE", "0.5")
+    return DocumentProcessor()
+
+
+def ocr_batch(ocred):
+    def run(page_numbers):
+        ocred.extend(page_numbers)
+        return [{"page": number, "text": OCR_TEXT[number], "source": "ocr"} for number in page_numbers]
+    return run
+
+
+def test_complete_pdf_only_ocrs_skipped_pages(processor):
+    ocred = []
+    partial = processor.process_pdf(b"%PDF", early_exit=True, ocr_batch=ocr_batch(ocred), batch_size=1)
+    # The text layer already has the amount, so no page was OCR'd
+    assert ocred == []
+    assert partial["skipped_pages"] == [1, 3, 5]
+    assert not partial["text_complete"]
+
+    completed = processor.complete_pdf(b"%PDF", partial, ocr_batch=ocr_batch(ocred))
+    assert ocred == [1, 3, 5]
+    full = processor.process_pdf(b"%PDF", early_exit=False, ocr_batch=ocr_batch([]))
+    assert completed["text"] == full["text"]
+    assert completed["text_complete"]
+    assert completed["pages_processed"] == completed["pages_total"] == 5
+    assert completed["skipped_pages"] == []
+    assert completed["text_source"] == "mixed"
+
+
+def test_splice_pages_keeps_page_order():
+    pages = [{"page": 1, "text": "a\nb"}, {"page": 2, "text": ""}, {"page": 3, "text": "c"}]
+    text = DocumentProcessor.join_pages(pages)
+    offsets = DocumentProcessor.page_offsets(pages)
+    spliced = DocumentProcessor.splice_pages(text, offsets, [{"page": 2, "text": "new\n"}])
+    assert spliced == "a\nb\nnew\n\nc\n"
@@ -0,0 +1,229 @@
+import base64
+import re
+import socket
+import threading
+import time
+
+import pytest
+
+from email_monitor import AttachmentBudget, EmailMonitor
+
+
+HEADERS = b"Subject: Invoice\r\nFrom: Vendor <billing@vendor.example>\r\n\r\n"
+PDF = b"%PDF-1.4 scanned invoice"
+MESSAGE = (
+    b"Subject: Invoice\r\nFrom: Vendor <billing@vendor.example>\r\nMIME-Version: 1.0\r\n"
+    b"Content-Type: multipart/mixed; boundary=b\r\n\r\n"
+    b"--b\r\nContent-Type: text/plain\r\n\r\nSee attached\r\n"
+    b"--b\r\nContent-Type: application/pdf\r\nContent-Disposition: attachment; filename=invoice.pdf\r\n"
+    b"Content-Transfer-Encoding: base64\r\n\r\n" + base64.b64encode(PDF) + b"\r\n--b--\r\n"
+)
+
+
+class FakeIMAPServer:
+    """Just enough of an IMAP server for polling and IDLE: SELECT, UID SEARCH and FETCH"""
+
+    def __init__(self, uids=(), unseen=(), send_uidnext=True, send_bodystructure=True):
+        self.uids = list(uids)
+        self.unseen = set(unseen)
+        self.send_uidnext = send_uidnext
+        # Without BODYSTRUCTURE clients fall back to downloading whole messages
+        self.send_bodystructure = send_bodystructure
+        self.commands = []
+        self.idling = threading.Event()
+        self._idle_connection = None
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def deliver(self, uid: int, unseen: bool = True):
+        """Add a message, announcing it to a session in IDLE"""
+        self.uids.append(uid)
+        if unseen:
+            self.unseen.add(uid)
+        if self._idle_connection is not None:
+            self._idle_connection.sendall(f"* {len(self.uids)} EXISTS\r\n".encode())
+
+    def close(self):
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: socket.socket):
+        reader = connection.makefile('rb')
+        connection.sendall(b"* OK fake IMAP ready\r\n")
+        for raw in reader:
+            line = raw.decode().rstrip('\r\n')
+            tag, _, command = line.partition(' ')
+            self.commands.append(command)
+            verb = command.split(' ')[0].upper()
+            if verb == 'CAPABILITY':
+                connection.sendall(b"* CAPABILITY IMAP4rev1 IDLE MOVE\r\n")
+            elif verb in ('SELECT', 'EXAMINE'):
+                response = f"* {len(self.uids)} EXISTS\r\n* OK [UIDVALIDITY 1] UIDs valid\r\n"
+                if self.send_uidnext:
+                    response += f"* OK [UIDNEXT {max(self.uids, default=0) + 1}] Predicted next UID\r\n"
+                connection.sendall(response.encode())
+            elif verb == 'UID' and command.split(' ')[1].upper() == 'FETCH':
+                connection.sendall(self._uid_fetch(command))
+            elif verb == 'UID':
+                connection.sendall(self._uid_search(command).encode())
+            elif verb == 'IDLE':
+                connection.sendall(b"+ idling\r\n")
+                self._idle_connection = connection
+                self.idling.set()
+                if reader.readline().strip().upper() != b'DONE':
+                    return
+                self._idle_connection = None
+                self.idling.clear()
+            elif verb == 'LOGOUT':
+                connection.sendall(f"* BYE\r\n{tag} OK LOGOUT completed\r\n".encode())
+                return
+            connection.sendall(f"{tag} OK {verb} completed\r\n".encode())
+
+    def _uid_fetch(self, command: str) -> bytes:
+        """Every message is MESSAGE; its BODYSTRUCTURE is reduced to plain text, so it has no attachments"""
+        wanted = set()
+        for item in command.split(' ')[2].split(','):
+            low, _, high = item.partition(':')
+            wanted.update(range(int(low), int(high or low) + 1))
+        items = command.split(' ', 3)[3].upper()
+        response = b""
+        for sequence, uid in enumerate(self.uids, start=1):
+            if uid not in wanted:
+                continue
+            if items == '(RFC822)':
+                response += f'* {sequence} FETCH (UID {uid} RFC822 {{{len(MESSAGE)}}}\r\n'.encode() + MESSAGE + b")\r\n"
+                continue
+            response += f'* {sequence} FETCH (UID {uid}'.encode()
+            if 'RFC822.SIZE' in items:
+                response += f' RFC822.SIZE {len(MESSAGE)}'.encode()
+            if 'BODYSTRUCTURE' in items and self.send_bodystructure:
+                response += (
+                    b' BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1) '
+                    + f'BODY[HEADER.FIELDS (SUBJECT FROM DATE)] {{{len(HEADERS)}}}\r\n'.encode() + HEADERS
+                )
+            response += b")\r\n"
+        return response
+
+    def _uid_search(self, command: str) -> str:
+        criteria = command.split(' ', 2)[2].upper()
+        if criteria == 'UNSEEN':
+            found = sorted(self.unseen)
+        elif criteria == 'ALL':
+            found = sorted(self.uids)
+        else:
+            match = re.fullmatch(r'UID (\d+):\*', criteria)
+            low = int(match.group(1))
+            # n:* always includes the highest UID, even when it is below n
+            found = sorted(uid for uid in self.uids if uid >= low) or self.uids[-1:]
+        return "* SEARCH" + "".join(f" {uid}" for uid in found) + "\r\n"
+
+
+@pytest.fixture
+def make_monitor(monkeypatch):
+    servers, monitors = [], []
+
+    def make(**server_options):
+        server = FakeIMAPServer(**server_options)
+        monkeypatch.setenv('EMAIL_HOST', '127.0.0.1')
+        monkeypatch.setenv('EMAIL_PORT', str(server.port))
+        monkeypatch.setenv('EMAIL_USE_SSL', 'false')
+        monkeypatch.setenv('EMAIL_USER', 'user')
+        monkeypatch.setenv('EMAIL_PASSWORD', 'password')
+        monitor = EmailMonitor()
+        servers.append(server)
+        monitors.append(monitor)
+        return server, monitor
+
+    yield make
+    for monitor in monitors:
+        monitor.close()
+    for server in servers:
+        server.close()
+
+
+def test_read_mail_above_newest_unread_does_not_wake(make_monitor):
+    server, monitor = make_monitor(uids=[50, 60], unseen=[50])
+    assert [new_email.id for new_email in monitor.check_new_emails()] == ['50']
+    results = [monitor.wait_for_new_mail(timeout=0.2) for _ in range(3)]
+    assert results == [False, False, False]
+    assert server.commands.count('IDLE') == 3
+
+
+def test_mail_between_poll_and_idle_is_caught(make_monitor):
+    server, monitor = make_monitor(uids=[60], unseen=[])
+    assert monitor.check_new_emails() == []
+    server.deliver(61)
+    started = time.monotonic()
+    assert monitor.wait_for_new_mail(timeout=30) is True
+    assert time.monotonic() - started < 5
+    assert 'IDLE' not in server.commands
+
+
+def test_catch_up_without_uidnext_searches_all(make_monitor):
+    server, monitor = make_monitor(uids=[60], unseen=[], send_uidnext=False)
+    monitor.check_new_emails()
+    server.deliver(61)
+    assert monitor.wait_for_new_mail(timeout=30) is True
+    assert 'UID SEARCH ALL' in server.commands
+
+
+def test_idle_returns_when_server_reports_exists(make_monitor):
+    server, monitor = make_monitor(uids=[60], unseen=[])
+    monitor.check_new_emails()
+
+    def deliver_during_idle():
+        server.idling.wait(5)
+        server.deliver(61)
+
+    threading.Thread(target=deliver_during_idle, daemon=True).start()
+    started = time.monotonic()
+    assert monitor.wait_for_new_mail(timeout=30) is True
+    assert time.monotonic() - started < 5
+    # The IDLE was ended with DONE and its tagged response read, so the session is reusable
+    assert monitor.wait_for_new_mail(timeout=0.2) is True
+
+
+def test_idle_times_out_without_new_mail(make_monitor):
+    server, monitor = make_monitor(uids=[60], unseen=[])
+    monitor.check_new_emails()
+    started = time.monotonic()
+    assert monitor.wait_for_new_mail(timeout=0.3) is False
+    assert time.monotonic() - started >= 0.3
+
+
+class RecordingBudget(AttachmentBudget):
+    """Records the IMAP commands sent before each reservation"""
+
+    def __init__(self, server, max_bytes):
+        super().__init__(max_bytes)
+        self.server = server
+        self.acquired = []
+
+    def acquire(self, size):
+        self.acquired.append((size, list(self.server.commands)))
+        super().acquire(size)
+
+
+def test_full_message_fallback_reserves_budget_before_download(make_monitor):
+    server, monitor = make_monitor(uids=[50], unseen=[50], send_bodystructure=False)
+    budget = RecordingBudget(server, max_bytes=10 * 1024 * 1024)
+    new_emails = list(monitor.iter_new_emails(budget=budget))
+
+    assert [attachment.content for attachment in new_emails[0].attachments] == [PDF]
+    size, commands_before = budget.acquired[-1]
+    assert size == len(MESSAGE)
+    assert not any(command.endswith('(RFC822)') for command in commands_before)
+    assert any(command.endswith('(RFC822)') for command in server.commands)
+    # Once parsed, only the attachment stays reserved until the email is processed
+    assert new_emails[0].size == len(PDF)
+    assert budget.stats()["in_flight_bytes"] == len(PDF)
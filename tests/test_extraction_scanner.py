@@ -0,0 +1,147 @@
+import random
+import re
+from datetime import datetime
+
+from extraction_scanner import (
+    AMOUNT_PATTERNS, DATE_PATTERNS, INVOICE_PATTERNS, STANDALONE_INVOICE_PATTERNS, ExtractionScanner
+)
+
+SCANNER = ExtractionScanner(AMOUNT_PATTERNS, DATE_PATTERNS, INVOICE_PATTERNS, STANDALONE_INVOICE_PATTERNS)
+
+
+# The per-field extractors the scanner replaced, kept as the reference it must match
+
+def reference_amounts(text):
+    amounts = []
+    seen_amounts = set()
+    for pattern in AMOUNT_PATTERNS:
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            amount_str = match.group(1) if match.groups() else match.group(0)
+            amount_str = re.sub(r'[^\d.,]', '', amount_str).replace(',', '')
+            try:
+                amount = float(amount_str)
+                if 0.01 <= amount <= 1000000 and amount not in seen_amounts:
+                    amounts.append(amount)
+                    seen_amounts.add(amount)
+            except ValueError:
+                continue
+    amounts.sort(reverse=True)
+    return amounts
+
+
+def reference_dates(text):
+    dates = []
+    seen_dates = set()
+    for pattern in DATE_PATTERNS:
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            for fmt in ['%m/%d/%Y', '%m-%d-%Y', '%Y-%m-%d', '%B %d, %Y', '%B %d %Y', '%b %d, %Y', '%b %d %Y']:
+                try:
+                    date = datetime.strptime(match.group(0), fmt)
+                    if date not in seen_dates:
+                        dates.append(date)
+                        seen_dates.add(date)
+                    break
+                except ValueError:
+                    continue
+    return dates
+
+
+def reference_invoice_numbers(text):
+    invoice_numbers = []
+    seen_numbers = set()
+    for pattern in INVOICE_PATTERNS:
+        for match in re.finditer(pattern, text):
+            if len(match.groups()) > 0:
+                invoice_num = match.group(1).strip()
+                if invoice_num and invoice_num not in seen_numbers:
+                    invoice_numbers.append(invoice_num)
+                    seen_numbers.add(invoice_num)
+    for pattern in STANDALONE_INVOICE_PATTERNS:
+        for match in re.finditer(pattern, text):
+            invoice_num = match.group(1).strip()
+            if invoice_num and invoice_num not in seen_numbers and len(invoice_num) >= 6:
+                invoice_numbers.append(invoice_num)
+                seen_numbers.add(invoice_num)
+    return invoice_numbers
+
+
+FRAGMENTS = [
+    "Total", "TOTAL:", "Amount Due", "Balance", "Due", "USD", "CAD", "$", "$ ", "Invoice", "invoice #",
+    "Invoice Number:", "INV", "inv#", "Bill #", "Reference", "ref", "INV-2024-", "ABC", "Jan", "January",
+    "Sept", "Febuary", "March", "Dec", ",", ".", "-", "/", ":", " ", " ", "\n", "\t",
+    "١٢٣", "٣", "１２", "é", "Ⅻ",
+    # Letters that case-fold onto ASCII ones under IGNORECASE
+    "ſep", "\u212aB", "İnvoice", "ınv", "TOTAL", "ſ", "ﬀ",
+]
+
+
+def random_number(rng):
+    digits = "".join(rng.choice("0123456789") for _ in range(rng.randint(1, 8)))
+    if rng.random() < 0.3:
+        digits = f"{int(digits):,}"
+    if rng.random() < 0.5:
+        digits += "." + "".join(rng.choice("0123456789") for _ in range(rng.choice((1, 2, 2, 3))))
+    return digits
+
+
+def random_date(rng):
+    month, day, year = rng.randint(0, 13), rng.randint(0, 32), rng.randint(1990, 2030)
+    return rng.choice([
+        f"{month}/{day}/{year}", f"{month:02d}-{day:02d}-{year}", f"{year}-{month}-{day}",
+        f"{rng.choice(['January', 'March', 'Jan', 'Sep', 'Sept', 'December', 'Dec'])} {day}, {year}",
+        f"{rng.choice(['May', 'Oct', 'October'])} {day} {year}",
+    ])
+
+
+def random_text(rng):
+    pieces = []
+    for _ in range(rng.randint(1, 40)):
+        roll = rng.random()
+        if roll < 0.3:
+            pieces.append(rng.choice(FRAGMENTS))
+        elif roll < 0.55:
+            pieces.append(random_number(rng))
+        elif roll < 0.7:
+            pieces.append(random_date(rng))
+        elif roll < 0.85:
+            pieces.append("".join(rng.choice("ABCINVX-0123456789") for _ in range(rng.randint(3, 14))))
+        else:
+            pieces.append(rng.choice([" ", "\n", ": ", " # "]))
+    return "".join(pieces)
+
+
+def test_scanner_matches_reference_extractors():
+    rng = random.Random(2024)
+    for _ in range(3000):
+        text = random_text(rng)
+        fields = SCANNER.extract(text)
+        assert fields["amounts"] == reference_amounts(text), text
+        assert fields["dates"] == reference_dates(text), text
+        assert fields["invoice_numbers"] == reference_invoice_numbers(text), text
+
+
+def test_sample_invoice():
+    text = (
+        "Tech Solutions Inc.\nInvoice Number: INV-2024-001234\nDate: 03/15/2024\n"
+        "Due March 30, 2024\nCloud hosting $1,250.00\nSupport $480.00\nTotal: $1,730.00\nRef ABCD1234567"
+    )
+    fields = SCANNER.extract(text)
+    assert fields["amounts"] == [1730.0, 1250.0, 480.0]
+    assert fields["dates"] == [datetime(2024, 3, 15), datetime(2024, 3, 30)]
+    assert fields["invoice_numbers"] == ["INV-2024-001234", "ABCD1234567"]
+
+
+def test_extract_only_requested_fields():
+    text = "Invoice # INV-2024-0001 dated 01/02/2024 for $5.00"
+    assert SCANNER.extract(text, fields=("dates",)) == {"dates": [datetime(2024, 1, 2)]}
+    assert SCANNER.extract(text, fields=("amounts", "invoice_numbers")) == {
+        "amounts": [5.0],
+        "invoice_numbers": ["INV-2024-0001"],
+    }
+
+
+def test_scan_yields_tokens_in_text_order():
+    tokens = list(SCANNER.scan("Total $12.50 on 01/02/2024, Invoice INV-2024-0001"))
+    starts = [token.start for token in tokens]
+    assert starts == sorted(starts)
+    assert {token.kind for token in tokens} == {"amount", "date", "invoice", "standalone_invoice"}
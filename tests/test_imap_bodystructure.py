@@ -0,0 +1,89 @@
+from imap_bodystructure import Literal, _tokenize, parse_fetch_response, walk_bodystructure
+
+
+def test_tokenize_atoms_quoted_strings_and_nil():
+    tokens = list(_tokenize([b'(UID 7 FLAGS (\\Seen) "a \\"q\\" b" NIL BODY[HEADER.FIELDS (SUBJECT)])']))
+    assert tokens == [b'(', 'UID', '7', 'FLAGS', b'(', '\\Seen', b')', 'a "q" b', None,
+                      'BODY[HEADER.FIELDS (SUBJECT)]', b')']
+
+
+def test_tokenize_keeps_literals_apart_from_atoms():
+    tokens = list(_tokenize([(b'1 (BODY[1] {5}', b'hello'), b')']))
+    assert tokens == ['1', b'(', 'BODY[1]', Literal(b'hello'), b')']
+    assert isinstance(tokens[3], Literal)
+
+
+def test_literal_filename_in_disposition():
+    # Names with quotes or 8-bit characters come back as literals
+    data = [
+        (b'1 (UID 9 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+         b'("APPLICATION" "PDF" ("NAME" {8}', b'Q"1".pdf'),
+        (b') NIL NIL "BASE64" 1200 NIL ("ATTACHMENT" ("FILENAME" {12}', 'Résumé.pdf'.encode()),
+        b')) NIL NIL) "MIXED"))',
+    ]
+    [message] = parse_fetch_response(data)
+    parts = list(walk_bodystructure(message['BODYSTRUCTURE']))
+    attachment = parts[1]
+    assert attachment.section == '2'
+    assert attachment.params == {'name': 'Q"1".pdf'}
+    assert attachment.disposition == 'attachment'
+    assert attachment.filename == 'Résumé.pdf'
+
+
+def test_literal_name_without_disposition_filename():
+    data = [
+        (b'1 (UID 3 BODYSTRUCTURE ("IMAGE" "PNG" ("NAME" {8}', b'Q"1".png'),
+        b') NIL NIL "BASE64" 300 NIL ("INLINE" NIL) NIL NIL))',
+    ]
+    [message] = parse_fetch_response(data)
+    [part] = walk_bodystructure(message['BODYSTRUCTURE'])
+    assert part.disposition == 'inline'
+    assert part.filename == 'Q"1".png'
+
+
+def test_missing_disposition():
+    structure = parse_fetch_response([
+        b'1 (BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 20 2)'
+        b'("APPLICATION" "PDF" ("NAME" "scan.pdf") NIL NIL "BASE64" 900) "MIXED"))'
+    ])[0]['BODYSTRUCTURE']
+    text, pdf = walk_bodystructure(structure)
+    assert (text.section, text.encoding, text.disposition) == ('1', 'quoted-printable', None)
+    assert (pdf.section, pdf.size, pdf.disposition, pdf.disposition_params) == ('2', 900, None, {})
+    assert pdf.filename == 'scan.pdf'
+
+
+def test_nested_message_rfc822_sections():
+    structure = parse_fetch_response([
+        b'1 (BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 2000 '
+        b'("Mon, 1 Jan 2024 00:00:00 +0000" "Fwd" NIL NIL NIL NIL NIL NIL NIL NIL) '
+        b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1)'
+        b'("APPLICATION" "PDF" ("NAME" "inner.pdf") NIL NIL "BASE64" 1000 NIL ("ATTACHMENT" ("FILENAME" "inner.pdf"))) '
+        b'"MIXED") 40 NIL ("ATTACHMENT" NIL)) "MIXED"))'
+    ])[0]['BODYSTRUCTURE']
+    parts = [(part.section, part.content_type, part.disposition, part.filename)
+             for part in walk_bodystructure(structure)]
+    assert parts == [
+        ('1', 'text/plain', None, None),
+        ('2', 'message/rfc822', 'attachment', None),
+        ('2.1', 'text/plain', None, None),
+        ('2.2', 'application/pdf', 'attachment', 'inner.pdf'),
+    ]
+
+
+def test_single_part_message_inside_rfc822():
+    structure = parse_fetch_response([
+        b'1 (BODYSTRUCTURE ("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 '
+        b'(NIL NIL NIL NIL NIL NIL NIL NIL NIL NIL) '
+        b'("APPLICATION" "PDF" ("NAME" "only.pdf") NIL NIL "BASE64" 300) 10))'
+    ])[0]['BODYSTRUCTURE']
+    sections = [(part.section, part.content_type) for part in walk_bodystructure(structure)]
+    assert sections == [('1', 'message/rfc822'), ('1.1', 'application/pdf')]
+
+
+def test_several_messages_in_one_response():
+    messages = parse_fetch_response([
+        b'1 (UID 10 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 1 1))',
+        b'2 (UID 11 BODYSTRUCTURE ("TEXT" "HTML" NIL NIL NIL "7BIT" 2 1))',
+    ])
+    assert [message['UID'] for message in messages] == ['10', '11']
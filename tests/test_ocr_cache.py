@@ -0,0 +1,64 @@
+import pytest
+
+from ocr_cache import OCRCache
+from ocr_engine import OCREngine, OCRJob, OCRResult
+
+PDF = b"%PDF-1.4 scanned invoice"
+PARTIAL = {
+    "text": "Invoice INV-2041\nTotal: 1,250.00\n\n\n",
+    "text_source": "ocr",
+    "pages_total": 3,
+    "pages_processed": 1,
+    "skipped_pages": [2, 3],
+    "page_offsets": [0, 33, 34]
+}
+FULL = {
+    "text": "Invoice INV-2041\nTotal: 1,250.00\nline items\nterms\n",
+    "text_source": "ocr",
+    "pages_total": 3,
+    "pages_processed": 3,
+    "skipped_pages": [],
+    "page_offsets": None
+}
+
+
+@pytest.fixture
+def engine():
+    # No job is submitted, so no worker process is started
+    engine = OCREngine(max_workers=1, cache=OCRCache(collection=None))
+    yield engine
+    engine.shutdown()
+
+
+def remember(engine, job, data):
+    key, _ = engine._lookup(job)
+    engine._remember(key, OCRResult(job=job, data=dict(data, content_type=job.content_type)))
+
+
+def test_partial_entry_serves_early_exit_jobs(engine):
+    remember(engine, OCRJob(PDF, "application/pdf", early_exit=True), PARTIAL)
+    _, cached = engine._lookup(OCRJob(PDF, "application/pdf", early_exit=True))
+    assert cached is not None and cached.cached
+    assert cached.data["text"] == PARTIAL["text"]
+    assert not cached.data["text_complete"]
+    assert cached.data["skipped_pages"] == [2, 3]
+    assert cached.data["page_offsets"] == [0, 33, 34]
+
+
+def test_partial_entry_is_a_miss_without_early_exit(engine):
+    remember(engine, OCRJob(PDF, "application/pdf", early_exit=True), PARTIAL)
+    _, cached = engine._lookup(OCRJob(PDF, "application/pdf", early_exit=False))
+    assert cached is None
+    _, cached = engine._lookup(OCRJob(PDF, "application/pdf", partial=PARTIAL))
+    assert cached is None
+
+
+def test_full_result_replaces_partial_entry(engine):
+    remember(engine, OCRJob(PDF, "application/pdf", early_exit=True), PARTIAL)
+    remember(engine, OCRJob(PDF, "application/pdf", early_exit=False), FULL)
+    for early_exit in (True, False):
+        _, cached = engine._lookup(OCRJob(PDF, "application/pdf", early_exit=early_exit))
+        assert cached.data["text"] == FULL["text"]
+        assert cached.data["text_complete"]
+        assert cached.data["skipped_pages"] == []
+    assert engine.cache.stats()["entries_in_memory"] == 1